@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# KB/s for page downloads outside any scheduled window; 0 means uncapped.
+DEFAULT_KBPS = int(os.getenv("MDEX_BANDWIDTH", 0))
+# Per-hour overrides, e.g. "8-23:1024,23-8:0" caps daytime to 1 MB/s and leaves nights open.
+SCHEDULE = os.getenv("MDEX_BANDWIDTH_SCHEDULE", "")
+# Chapters published within this many days are "new" and go ahead of backfill.
+NEW_DAYS = float(os.getenv("MDEX_NEW_DAYS", 7))
+
+NEW = 0
+BACKFILL = 1
+
+
+def parse_schedule(spec: str) -> list:
+    """Turn "START-END:KBPS,..." into [(start_hour, end_hour, bytes per second)]; END may wrap past midnight."""
+    windows = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        hours, kbps = part.split(":")
+        start, end = (int(h) % 24 for h in hours.split("-"))
+        windows.append((start, end, int(kbps) * 1024))
+    return windows
+
+
+def chapter_priority(chapter, now: datetime = None) -> int:
+    """NEW for recently published chapters, BACKFILL for everything older (or undated)."""
+    stamp = getattr(chapter, "published_at", None) or getattr(chapter, "created_at", None)
+    if not stamp:
+        return BACKFILL
+    try:
+        published = datetime.fromisoformat(stamp)
+    except ValueError:
+        return BACKFILL
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return NEW if now - published <= timedelta(days=NEW_DAYS) else BACKFILL
+
+
+class BandwidthScheduler:
+    """Token bucket over downloaded bytes, shared by every page worker in the process.
+
+    Waiting workers queue by (priority, arrival), and only the head of the queue
+    is handed tokens, so while the link is capped a chapter of NEW pages never
+    waits behind a backfill. The cap is looked up on every refill, so crossing
+    into a different schedule window takes effect within a second.
+    """
+
+    def __init__(self, default_kbps: int = DEFAULT_KBPS, schedule: str = SCHEDULE):
+        self.default = default_kbps * 1024
+        self.windows = parse_schedule(schedule)
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.order = itertools.count()
+        self.waited = 0.0
+
+    def rate(self, hour: int = None) -> int:
+        """Bytes per second allowed at `hour` (now by default); 0 means uncapped."""
+        hour = datetime.now().hour if hour is None else hour
+        for start, end, rate in self.windows:
+            inside = start <= hour < end if start < end else hour >= start or hour < end
+            if inside:
+                return rate
+        return self.default
+
+    def _refill(self, rate: int):
+        now = time.monotonic()
+        # One second of burst is enough to keep a CHUNK-sized read moving.
+        self.tokens = min(rate, self.tokens + (now - self.last) * rate)
+        self.last = now
+
+    def acquire(self, n: int, priority: int = BACKFILL):
+        """Block until `n` bytes may be read at `priority`; returns the seconds spent waiting."""
+        if not self.rate():
+            return 0.0
+        start = time.monotonic()
+        with self.cond:
+            ticket = (priority, next(self.order))
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    rate = self.rate()
+                    if not rate:
+                        break
+                    self._refill(rate)
+                    if self.waiting[0] == ticket:
+                        # Reads bigger than the burst go through once the bucket is full and leave it in debt.
+                        need = min(n, rate)
+                        if self.tokens >= need:
+                            self.tokens -= n
+                            break
+                        self.cond.wait(min(1.0, (need - self.tokens) / rate))
+                    else:
+                        self.cond.wait(1.0)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+            waited = time.monotonic() - start
+            self.waited += waited
+        return waited
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> BandwidthScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BandwidthScheduler()
+        return _scheduler
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for chapter_catalog.py.
+
+Builds synthetic, shuffled chapter feeds (several languages, several scanlation
+uploads of the same chapter, a few external uploads) and times building a
+ChapterCatalog against the old sort_chapters (filter, sorted() on float, then a
+dict keyed by chapter label), plus range() against the old filtered list scan.
+Runs take turns so machine noise lands on both alike.
+
+    ./bench_catalog.py --chapters 10000 --runs 50
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from chapter_catalog import EXTERNAL_UPLOADERS, ChapterCatalog
+
+
+def make_feed(chapters: int, rng: random.Random) -> list:
+    """A /manga/{id}/feed worth of chapters, most numbers uploaded more than once."""
+    uploaders = [SimpleNamespace(username=f"group{n}") for n in range(8)]
+    uploaders += [SimpleNamespace(username=name) for name in EXTERNAL_UPLOADERS]
+    feed = []
+    number = 0
+    while len(feed) < chapters:
+        number += 1
+        label = f"{number}.5" if rng.random() < 0.05 else str(number)
+        for _ in range(rng.choice((1, 1, 2, 3))):
+            feed.append(
+                SimpleNamespace(
+                    chapter=label,
+                    language=rng.choice(("en", "en", "en", "es-la", "fr")),
+                    uploader=rng.choice(uploaders[:8] * 4 + uploaders[8:]),
+                )
+            )
+    rng.shuffle(feed)
+    return feed[:chapters]
+
+
+def old_sort_chapters(chapters: list) -> list:
+    """mangadex.sort_chapters before ChapterCatalog."""
+    eng_chapters = [
+        x
+        for x in chapters
+        if x.language == "en"
+        if x.uploader.username not in EXTERNAL_UPLOADERS
+        if x.chapter
+    ]
+    sorted_chapters = sorted(eng_chapters, key=lambda chap: float(chap.chapter))
+    unique_chapters_dict = {}
+    for chapter in sorted_chapters:
+        chapter_number = chapter.chapter
+        if chapter_number not in unique_chapters_dict:
+            unique_chapters_dict[chapter_number] = chapter
+    return list(unique_chapters_dict.values())
+
+
+def best_of(fns: dict, runs: int) -> dict:
+    """Best time of each function, taking turns round by round so background noise hits them alike."""
+    best = dict.fromkeys(fns, float("inf"))
+    for _ in range(runs):
+        for name, fn in fns.items():
+            start = time.perf_counter()
+            fn()
+            best[name] = min(best[name], time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    feed = make_feed(args.chapters, random.Random(10))
+    old = old_sort_chapters(feed)
+    catalog = ChapterCatalog(feed)
+    assert list(catalog) == old, "ChapterCatalog disagrees with the old sort_chapters"
+    start, end = float(old[len(old) // 4].chapter), float(old[len(old) // 2].chapter)
+    old_range = [x for x in old_sort_chapters(feed) if start <= float(x.chapter) <= end]
+    assert catalog.range(start, end) == old_range, "range() disagrees with the old selection"
+
+    print(f"{args.chapters} chapters in the feed, {len(old)} after filtering and dedupe")
+    rows = best_of(
+        {
+            "old sort_chapters": lambda: old_sort_chapters(feed),
+            "ChapterCatalog": lambda: ChapterCatalog(feed),
+            "old select range": lambda: [x for x in old if start <= float(x.chapter) <= end],
+            "catalog.range": lambda: catalog.range(start, end),
+        },
+        args.runs,
+    )
+    for name, elapsed in rows.items():
+        print(f"{name:<20} {elapsed * 1000:8.2f} ms")
+    baseline = rows["old sort_chapters"]
+    print(f"build: catalog / old = {rows['ChapterCatalog'] / baseline:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Offline benchmark for hunt.py's attributes.xml parsing.
+
+Writes a synthetic attributes.xml (a last match of --teams teams, stale slots
+from a bigger earlier match, and --filler unrelated attributes) and compares the
+old line-by-line regex parser with hunt.py's roster parser: time and peak
+Python memory, and that the roster is exactly the last match's players. A
+second profile gives players names with a literal ">" and &quot;/&gt;/&amp;
+entities, which the roster parser must read as the game meant them.
+
+    ./bench_hunt.py --filler 200000 --runs 5
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from xml.sax.saxutils import quoteattr
+
+import hunt
+
+TRICKY_NAMES = [
+    ("x>y", "x>y"),
+    ("&quot;Doc&quot; Holliday", '"Doc" Holliday'),
+    ("a &gt; b", "a > b"),
+    ("Tom &amp; Jerry", "Tom & Jerry"),
+]
+
+
+def regex_parse(source):
+    """The parse_stats() hunt.py used before the roster parser."""
+    with open(source, "r") as f:
+        dictos = {}
+        for i in f.readlines():
+            if "blood_line_name" in i:
+                name = re.search(r'value="(.*?)"', i).group(1).rstrip()
+            if "mmr" in i and "MissionBagPlayer" in i and "ui_mmr" not in i:
+                mmr = re.search(r'value="(.*?)"', i).group(1)
+                dictos[name] = mmr
+    return dictos
+
+
+def write_profile(dest, teams, stale, filler, rng, names=None):
+    """Write the profile and return {name: MMR string} of the last match's players.
+
+    `names`, if given, are (value as written in the file, name after XML
+    unescaping) pairs cycled through as blood_line_names, so a value can carry a
+    literal ">" or entities such as &quot; exactly as the game might write them.
+    """
+    attrs = [("MissionBagNumTeams", teams)]
+    raw = {}
+    expected = {}
+    for t in range(teams + stale):
+        size = rng.randint(1, 3)
+        attrs += [
+            (f"MissionBagTeam_{t}_mmr", rng.randint(1500, 3500)),
+            (f"MissionBagTeam_{t}_numplayers", size),
+            (f"MissionBagTeam_{t}_ownteam", "true" if t == 0 else "false"),
+        ]
+        for p in range(size):
+            name = f"Hunter {t}-{p}"
+            mmr = rng.randint(1500, 3500)
+            key = f"MissionBagPlayer_{t}_{p}_blood_line_name"
+            if names:
+                written, name = names[(t * 3 + p) % len(names)]
+                name = f"{name} {t}-{p}"
+                raw[key] = f'"{written} {t}-{p}"'
+            attrs += [
+                (key, name),
+                (f"MissionBagPlayer_{t}_{p}_mmr", mmr),
+                (f"MissionBagPlayer_{t}_{p}_profileid", rng.getrandbits(40)),
+            ]
+            if t < teams:
+                expected[name] = str(mmr)
+    attrs += [(f"UnlockedItem_{n}_state", rng.randint(0, 9)) for n in range(filler)]
+    attrs.sort()
+    with open(dest, "w") as f:
+        f.write('<Attributes Version="37">\n')
+        for name, value in attrs:
+            f.write(f" <Attr name={quoteattr(name)} value={raw.get(name) or quoteattr(str(value))}/>\n")
+        f.write("</Attributes>\n")
+    return expected
+
+
+def measure(fn, source, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(source)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn(source)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teams", type=int, default=12)
+    parser.add_argument("--stale", type=int, default=4, help="teams left over from an earlier, bigger match")
+    parser.add_argument("--filler", type=int, default=200000, help="unrelated attributes in the profile")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    fd, source = tempfile.mkstemp(suffix=".xml", prefix="attributes-")
+    os.close(fd)
+    try:
+        expected = write_profile(source, args.teams, args.stale, args.filler, random.Random(3))
+        print(f"attributes.xml: {os.path.getsize(source) / 1048576:.1f} MB, {args.filler} filler attributes")
+        old, old_time, old_peak = measure(regex_parse, source, args.runs)
+        new, new_time, new_peak = measure(hunt.parse_stats, source, args.runs)
+        for name, elapsed, peak in (("regex readlines", old_time, old_peak), ("roster parser", new_time, new_peak)):
+            print(f"{name:<18} {elapsed * 1000:8.1f} ms  peak {peak / 1048576:7.2f} MB")
+        stale = {k for k in old if k not in new}
+        assert new == expected, "the roster parser missed or misread a player"
+        print(f"{len(new)} players; the regex parser also reported {len(stale)} stale players from the earlier match")
+
+        # Players pick their own names: a literal ">" is legal in an attribute value, and quotes arrive as entities.
+        expected = write_profile(source, args.teams, args.stale, args.filler, random.Random(3), TRICKY_NAMES)
+        new, new_time, _ = measure(hunt.parse_stats, source, args.runs)
+        assert new == expected, f"names with markup characters were misread: {set(new) ^ set(expected)}"
+        print(f"names with >, &quot; and &gt;: {new_time * 1000:.1f} ms, all {len(new)} players read correctly")
+    finally:
+        os.remove(source)
+
+
+if __name__ == "__main__":
+    main()
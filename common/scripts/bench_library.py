@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Offline benchmark for libraryparse.py.
+
+Builds a synthetic anime library (shows with seasons, specials and episode files)
+in a temporary directory and times the old serial LibraryParser walk against
+LibraryScanner cold, warm, and warm after a few shows gained an episode.
+--latency adds a delay to every directory listing and stat, standing in for an NFS/SMB round trip.
+
+    ./bench_library.py --shows 5000 --latency 0.5
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import libraryparse
+
+
+def build_tree(root: str, shows: int, rng: random.Random):
+    for n in range(shows):
+        show = os.path.join(root, f"Show {n:05d}")
+        seasons = rng.choice((0, 1, 1, 2, 3, 5))
+        for s in range(1, seasons + 1):
+            season = os.path.join(show, f"Season {s}")
+            os.makedirs(season)
+            for e in range(1, rng.randint(6, 26)):
+                open(os.path.join(season, f"S{s:02d}E{e:02d}.mkv"), "w").close()
+        os.makedirs(show, exist_ok=True)
+        if seasons == 0:
+            for e in range(1, rng.randint(1, 4)):
+                open(os.path.join(show, f"Movie {e}.mkv"), "w").close()
+        if rng.random() < 0.3:
+            specials = os.path.join(show, "Specials")
+            os.makedirs(specials)
+            for e in range(1, rng.randint(2, 6)):
+                open(os.path.join(specials, f"S00E{e:02d}.mkv"), "w").close()
+
+
+def with_latency(seconds: float):
+    """Slow down os.scandir and os.stat (and so os.walk) by `seconds` per call."""
+    real_scandir, real_stat = os.scandir, os.stat
+
+    def scandir(path="."):
+        time.sleep(seconds)
+        return real_scandir(path)
+
+    def stat(path, *args, **kwargs):
+        time.sleep(seconds)
+        return real_stat(path, *args, **kwargs)
+
+    os.scandir, os.stat = scandir, stat
+    return lambda: (setattr(os, "scandir", real_scandir), setattr(os, "stat", real_stat))
+
+
+def old_walk(root: str) -> dict:
+    """The original __main__ loop of libraryparse.py."""
+    libraryparse.root_directory = root
+    library_dict = {}
+    for subdir in libraryparse.get_dir_info(root)[0]:
+        seasons, season_episodes, specials = libraryparse.LibraryParser(subdir).parse_animes()
+        library_dict[subdir] = {
+            "Seasons": seasons,
+            "Episodes": season_episodes["total_episodes"],
+            "Specials": specials,
+        }
+    return library_dict
+
+
+def timed(name: str, fn, baseline: float = None):
+    start = time.monotonic()
+    result = fn()
+    elapsed = time.monotonic() - start
+    speedup = f"  {baseline / elapsed:6.1f}x" if baseline else ""
+    print(f"{name:<28} {elapsed:8.2f}s{speedup}")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shows", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.5, help="per listing/stat latency in ms")
+    parser.add_argument("--workers", type=int, default=libraryparse.WORKERS)
+    parser.add_argument("--touch", type=int, default=20, help="shows that gain an episode before the last run")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="library-bench-")
+    root = os.path.join(work, "Anime") + "/"
+    rng = random.Random(1)
+    start = time.monotonic()
+    build_tree(root, args.shows, rng)
+    print(f"Built {args.shows} shows in {time.monotonic() - start:.1f}s, {args.latency} ms per listing/stat")
+    cache = os.path.join(work, "cache.json")
+    restore = with_latency(args.latency / 1000)
+    try:
+        expected, baseline = timed("old serial walk", lambda: old_walk(root))
+
+        def scan():
+            scanner = libraryparse.LibraryScanner(root, cache, args.workers)
+            result = scanner.scan()
+            return result, scanner
+
+        for name in ("scanner (cold)", "scanner (warm)"):
+            (result, scanner), _ = timed(name, scan, baseline)
+            assert list(result.items()) == list(expected.items()), f"{name} report differs from the old walk"
+            print(f"  listed {scanner.listed} directories, {scanner.reused} shows unchanged")
+        shows = sorted(expected)
+        for show in rng.sample(shows, min(args.touch, len(shows))):
+            seasons = [d for d in os.listdir(os.path.join(root, show)) if d.startswith("Season")]
+            target = os.path.join(root, show, seasons[0]) if seasons else os.path.join(root, show)
+            open(os.path.join(target, "new episode.mkv"), "w").close()
+        expected = old_walk(root)
+        (result, scanner), _ = timed(f"scanner ({args.touch} changed)", scan, baseline)
+        assert list(result.items()) == list(expected.items()), "report after changes differs from the old walk"
+        print(f"  listed {scanner.listed} directories, {scanner.reused} shows unchanged")
+    finally:
+        restore()
+        if args.keep:
+            print(f"Kept {work}")
+        else:
+            shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
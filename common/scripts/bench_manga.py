@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""Offline benchmark for the manga pipeline.
+
+Starts a local stand-in for the MangaDex API (manga, chapter feed, at-home,
+list, auth and cover endpoints plus a fake Discord webhook) serving synthetic
+data, points mangadex.py / manga_update.py at it with a temporary directory in
+place of /mnt/NAS, and reports titles/min, chapters/s, MB/s and peak RSS.
+
+    ./bench_manga.py --titles 20 --chapters 30 --pages 12 --latency 40 --errors 0.01
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+LIST_ID = "fcf0cb49-964b-4aec-8f23-40c6e3524b7c"
+STAMP = "2024-01-01T00:00:00+00:00"
+
+
+def synthetic_page(rng, page_kb):
+    """A decodable JPEG of roughly page_kb when Pillow is around (so transcoding has real work), else filler bytes."""
+    try:
+        from PIL import Image
+        import io
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + bytes(rng.getrandbits(8) for _ in range(page_kb * 1024 - 4))
+    side = max(16, int((page_kb * 1024 * 2) ** 0.5))
+    noise = bytes(rng.getrandbits(6) + x % 128 for x in range(side * side))
+    buf = io.BytesIO()
+    Image.frombytes("L", (side, side), noise).save(buf, format="JPEG", quality=95)
+    return buf.getvalue()
+
+
+class FakeMangaDex:
+    """Synthetic library: `titles` manga, each with `chapters` English chapters of `pages` pages."""
+
+    def __init__(self, titles, chapters, pages, page_kb, latency_ms, error_rate, seed=0):
+        rng = random.Random(seed)
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rng = random.Random(seed + 1)
+        self.rng_lock = threading.Lock()
+        self.page = synthetic_page(rng, page_kb)
+        self.pages = pages
+        self.manga = {}
+        self.chapters = {}
+        self.requests = 0
+        for t in range(titles):
+            manga_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            ids = []
+            for c in range(1, chapters + 1):
+                chapter_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                self.chapters[chapter_id] = {
+                    "manga": manga_id,
+                    "number": str(c),
+                    "volume": str((c - 1) // 10 + 1),
+                    "title": f"Chapter {c}",
+                }
+                ids.append(chapter_id)
+            self.manga[manga_id] = {"title": f"Bench Title {t}", "chapters": ids}
+
+    def roll_error(self):
+        with self.rng_lock:
+            return self.rng.random() < self.error_rate
+
+    def manga_json(self, manga_id):
+        manga = self.manga[manga_id]
+        return {
+            "id": manga_id,
+            "type": "manga",
+            "attributes": {
+                "title": {"en": manga["title"]},
+                "altTitles": [],
+                "description": {"en": "Synthetic benchmark title."},
+                "isLocked": False,
+                "links": {},
+                "originalLanguage": "ja",
+                "lastVolume": "",
+                "lastChapter": "",
+                "publicationDemographic": "shounen",
+                "status": "ongoing",
+                "year": 2024,
+                "contentRating": "safe",
+                "chapterNumbersResetOnNewVolume": False,
+                "availableTranslatedLanguages": ["en"],
+                "latestUploadedChapter": manga["chapters"][-1] if manga["chapters"] else None,
+                "tags": [],
+                "state": "published",
+                "createdAt": STAMP,
+                "updatedAt": STAMP,
+                "version": 1,
+            },
+            "relationships": [
+                {
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, manga_id + "author")),
+                    "type": "author",
+                    "attributes": {
+                        "name": "Bench Author",
+                        "imageUrl": None,
+                        "biography": {},
+                        "createdAt": STAMP,
+                        "updatedAt": STAMP,
+                        "version": 1,
+                    },
+                },
+                {
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, manga_id + "cover")),
+                    "type": "cover_art",
+                    "attributes": {
+                        "description": "",
+                        "volume": "1",
+                        "fileName": "cover.jpg",
+                        "locale": "ja",
+                        "createdAt": STAMP,
+                        "updatedAt": STAMP,
+                        "version": 1,
+                    },
+                },
+            ],
+        }
+
+    def chapter_json(self, chapter_id):
+        chapter = self.chapters[chapter_id]
+        return {
+            "id": chapter_id,
+            "type": "chapter",
+            "attributes": {
+                "volume": chapter["volume"],
+                "chapter": chapter["number"],
+                "title": chapter["title"],
+                "translatedLanguage": "en",
+                "externalUrl": None,
+                "publishAt": STAMP,
+                "readableAt": STAMP,
+                "createdAt": STAMP,
+                "updatedAt": STAMP,
+                "pages": self.pages,
+                "version": 1,
+            },
+            "relationships": [
+                {"id": chapter["manga"], "type": "manga"},
+                {
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, "group")),
+                    "type": "scanlation_group",
+                    "attributes": {"name": "Bench Scans"},
+                },
+                {
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, "user")),
+                    "type": "user",
+                    "attributes": {"username": "bench_uploader", "roles": [], "version": 1},
+                },
+            ],
+        }
+
+    def collection(self, items, query):
+        limit = int(query.get("limit", ["100"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        return {
+            "result": "ok",
+            "response": "collection",
+            "data": items[offset : offset + limit],
+            "limit": limit,
+            "offset": offset,
+            "total": len(items),
+        }
+
+    def route(self, method, path, query, base):
+        """Returns (status, content type, body)."""
+        parts = [p for p in path.split("/") if p]
+        if method == "POST" and parts[:1] == ["auth"]:
+            return 200, "application/json", {"result": "ok", "token": {"session": "s", "refresh": "r"}}
+        if method == "POST" and parts[:1] == ["webhook"]:
+            return 204, "application/json", None
+        if parts[:1] == ["list"] and len(parts) == 2:
+            rels = [{"id": m, "type": "manga"} for m in self.manga]
+            data = {"id": LIST_ID, "type": "custom_list", "attributes": {"name": "bench"}, "relationships": rels}
+            return 200, "application/json", {"result": "ok", "response": "entity", "data": data}
+        if parts == ["manga"]:
+            wanted = query.get("title", [""])[0].lower()
+            items = [self.manga_json(m) for m, v in self.manga.items() if wanted in v["title"].lower()]
+            return 200, "application/json", self.collection(items, query)
+        if parts[:1] == ["manga"] and len(parts) == 2 and parts[1] in self.manga:
+            return 200, "application/json", {"result": "ok", "response": "entity", "data": self.manga_json(parts[1])}
+        if parts[:1] == ["manga"] and len(parts) == 3 and parts[2] == "feed" and parts[1] in self.manga:
+            items = [self.chapter_json(c) for c in self.manga[parts[1]]["chapters"]]
+            return 200, "application/json", self.collection(items, query)
+        if parts[:1] == ["list"] and len(parts) == 3 and parts[2] == "feed":
+            # Like the real list feed: every chapter of the list's titles, filtered by createdAtSince only.
+            since = query.get("createdAtSince", [""])[0]
+            items = [self.chapter_json(c) for c in self.chapters if STAMP[:19] >= since]
+            return 200, "application/json", self.collection(items, query)
+        if parts == ["chapter"]:
+            # /chapter takes a single `manga` id; there is no manga[] filter.
+            wanted = query.get("manga", [None])[0]
+            items = [self.chapter_json(c) for c, ch in self.chapters.items() if wanted in (None, ch["manga"])]
+            return 200, "application/json", self.collection(items, query)
+        if parts[:1] == ["chapter"] and len(parts) == 2 and parts[1] in self.chapters:
+            return 200, "application/json", {"result": "ok", "response": "entity", "data": self.chapter_json(parts[1])}
+        if parts[:2] == ["at-home", "server"] and len(parts) == 3 and parts[2] in self.chapters:
+            files = [f"{n}-{hashlib.md5(f'{parts[2]}{n}'.encode()).hexdigest()}.jpg" for n in range(1, self.pages + 1)]
+            chapter = {"hash": parts[2].replace("-", ""), "data": files, "dataSaver": files}
+            return 200, "application/json", {"result": "ok", "baseUrl": base, "chapter": chapter}
+        if parts[:1] in (["data"], ["data-saver"], ["covers"]):
+            return 200, "image/jpeg", self.page
+        return 404, "application/json", {"result": "error", "errors": [{"status": 404}]}
+
+
+def serve(fake: FakeMangaDex):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def handle_any(self, method):
+            length = int(self.headers.get("Content-Length", 0))
+            if length:
+                self.rfile.read(length)
+            fake.requests += 1
+            if fake.latency:
+                time.sleep(fake.latency)
+            url = urlsplit(self.path)
+            if fake.roll_error():
+                status, ctype, body = 503, "application/json", {"result": "error"}
+            else:
+                base = f"http://{self.headers['Host']}"
+                status, ctype, body = fake.route(method, url.path, parse_qs(url.query), base)
+            if body is None:
+                payload = b""
+            elif isinstance(body, bytes):
+                payload = body
+            else:
+                payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self.handle_any("GET")
+
+        def do_POST(self):
+            self.handle_any("POST")
+
+    class Server(ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            # Clients dropping pooled keep-alive connections is normal here.
+            pass
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def report(name, elapsed, titles, chapters, nbytes):
+    elapsed = elapsed or 1e-9
+    print(
+        f"{name:<22} {elapsed:8.2f}s  {titles / elapsed * 60:9.1f} titles/min  "
+        f"{chapters / elapsed:8.1f} chapters/s  {nbytes / 1048576 / elapsed:7.2f} MB/s  "
+        f"peak RSS {peak_rss_mb():.0f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--titles", type=int, default=10)
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--page-kb", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=20, help="per-request latency in ms")
+    parser.add_argument("--errors", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--workers", type=int, default=4, help="title workers for the updates loop")
+    parser.add_argument("--rate", type=float, default=5, help="MDEX_RATE requests/s budget")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory")
+    args = parser.parse_args()
+
+    fake = FakeMangaDex(args.titles, args.chapters, args.pages, args.page_kb, args.latency, args.errors)
+    server, url = serve(fake)
+    work = tempfile.mkdtemp(prefix="manga-bench-")
+    home = os.path.join(work, "home")
+    os.makedirs(os.path.join(home, ".cache"))
+    bin_dir = os.path.join(work, "bin")
+    os.makedirs(bin_dir)
+    with open(os.path.join(bin_dir, "notify-send"), "w") as f:
+        f.write("#!/bin/sh\nexit 0\n")
+    os.chmod(os.path.join(bin_dir, "notify-send"), 0o755)
+
+    # Everything the scripts read at import time has to be set before importing them.
+    os.environ.update(
+        {
+            "HOME": home,
+            "PATH": f"{bin_dir}:{os.environ.get('PATH', '')}",
+            "MDEX_API": url,
+            "MANGA_ROOT": os.path.join(work, "nas") + "/",
+            "MDEX_INDEX": os.path.join(home, ".cache", "mdex_index.db"),
+            "TACO_BELL": base64.b64encode(f"{url}/webhook".encode()).decode(),
+            "NOTIFY_LINGER": "0.2",
+            "MDEX_RATE": str(args.rate),
+            # The real at-home limit (40/min) would dominate any run with more than a few dozen chapters.
+            "MDEX_AT_HOME_RATE": str(args.rate * 60),
+        }
+    )
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import http_client
+
+    # Covers and uploads are absolute URLs built by MangaDexPy; send them to the stand-in too.
+    real_request = http_client.request
+
+    def local_request(method, target, **kwargs):
+        parts = urlsplit(target)
+        if parts.scheme == "https" and parts.netloc.endswith("mangadex.org"):
+            target = f"{url}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return real_request(method, target, **kwargs)
+
+    http_client.request = local_request
+
+    import chapter_index
+    import helper
+    import mangadex
+    import manga_update
+
+    print(
+        f"Fake MangaDex at {url}: {args.titles} titles x {args.chapters} chapters x "
+        f"{args.pages} pages of {args.page_kb} KB, {args.latency} ms latency, {args.errors:.0%} errors"
+    )
+    manga_ids = list(fake.manga)
+    import metrics
+
+    metrics.start_run("bench")
+
+    def fresh_nas(name):
+        root = os.path.join(work, name) + "/"
+        helper.MANGA_ROOT = root
+        mangadex.MANGA_ROOT = root
+        chapter_index._index = chapter_index.ChapterIndex(os.path.join(work, f"{name}.db"))
+        return root
+
+    root = fresh_nas("single")
+    start = time.monotonic()
+    mangadex.USER_NAME_MangaDex(manga_id=manga_ids[0]).download_manga_en(show_bar=False)
+    report("download_manga_en", time.monotonic() - start, 1, args.chapters, dir_size(root))
+
+    root = fresh_nas("chapters")
+    manga = helper.new_client().get_manga(manga_ids[0])
+    chapters = mangadex.sort_chapters(manga.get_chapters())
+    start = time.monotonic()
+    helper.download_chapters(chapters, manga, show_bar=False)
+    report("download_chapters", time.monotonic() - start, 1, len(chapters), dir_size(root))
+
+    import metadata_cache
+
+    metadata_cache._cache = metadata_cache.MetadataCache(os.path.join(work, "meta.db"))
+    for name in ("search (cold)", "search (cached)"):
+        start = time.monotonic()
+        found = metadata_cache.get_cache().search(helper.new_client(), "bench title")
+        report(name, time.monotonic() - start, len(found), 0, 0)
+
+    root = fresh_nas("latest")
+    start = time.monotonic()
+    for manga_id in manga_ids:
+        manga_update.get_latest_chapter(manga_id)
+    manga_update.history.flush()
+    report("get_latest_chapter", time.monotonic() - start, len(manga_ids), 0, dir_size(root))
+
+    root = fresh_nas("updates")
+    start = time.monotonic()
+    mangadex.run_updates(helper.get_mdlist(), args.workers)
+    report(
+        f"updates (workers={args.workers})",
+        time.monotonic() - start,
+        len(manga_ids),
+        len(fake.chapters),
+        dir_size(root),
+    )
+
+    mangadex.get_queue().close()
+    stages = metrics.finish_run()
+    print("Stage totals: " + ", ".join(f"{s} {v:.2f}s" for s, v in sorted(stages.items(), key=lambda i: -i[1])))
+    print(f"Requests served: {fake.requests}")
+    server.shutdown()
+    if args.keep:
+        print(f"Kept {work}")
+    else:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""CBZ storage for chapters: one stored (uncompressed) zip per chapter instead of a directory of pages.
+
+    cbz.py convert [ROOT] [--dry-run]   pack existing chapter directories under ROOT into .cbz
+"""
+import os
+import shutil
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".avif", ".gif")
+CHUNK = 1024 * 1024
+WORKERS = int(os.getenv("CBZ_WORKERS", 4))
+
+
+def cbz_path(path_loc: str) -> str:
+    return path_loc.rstrip("/") + ".cbz"
+
+
+def comic_info(series: str, number: str, volume=None, title=None, writer=None, pages=0, web=None) -> bytes:
+    root = ElementTree.Element("ComicInfo")
+    for tag, value in (
+        ("Title", title),
+        ("Series", series),
+        ("Number", number),
+        ("Volume", volume),
+        ("Writer", writer),
+        ("PageCount", str(pages) if pages else None),
+        ("LanguageISO", "en"),
+        ("Web", web),
+    ):
+        if value:
+            ElementTree.SubElement(root, tag).text = str(value)
+    return ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def write_cbz(pages: list, dest: str, info: bytes):
+    """Stream `pages` (file paths, already in reading order) into a stored zip at `dest`, atomically."""
+    tmp = f"{dest}.tmp"
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("ComicInfo.xml", info)
+        for page in pages:
+            with open(page, "rb") as src, zf.open(os.path.basename(page), "w", force_zip64=True) as out:
+                shutil.copyfileobj(src, out, CHUNK)
+    os.replace(tmp, dest)
+
+
+def page_files(directory: str) -> list:
+    return sorted(
+        e.path
+        for e in os.scandir(directory)
+        if e.is_file() and e.name.lower().endswith(IMAGE_EXTS)
+    )
+
+
+def is_cbz_chapter(name: str) -> bool:
+    return name.endswith(".cbz") and not name.startswith(".")
+
+
+def chapter_dirs(root: str):
+    """Every {title}/{volume}/{chapter}/ directory that still holds loose pages."""
+    for title in os.scandir(root):
+        if not title.is_dir() or title.name.startswith("."):
+            continue
+        for volume in os.scandir(title.path):
+            if not volume.is_dir() or volume.name.startswith("."):
+                continue
+            for chapter in os.scandir(volume.path):
+                if chapter.is_dir() and not chapter.name.startswith("."):
+                    yield title.name, volume.name, chapter.path
+
+
+def convert_one(title: str, volume: str, path: str, dry_run: bool = False):
+    """Pack one chapter directory; the directory is only removed after the archive is in place and readable."""
+    pages = page_files(path)
+    if not pages:
+        return 0, 0
+    size = sum(os.path.getsize(p) for p in pages)
+    if dry_run:
+        return 1, size
+    number = os.path.basename(path).split(" ", 1)[0]
+    volume_number = volume[len("Volume ") :] if volume.startswith("Volume ") else None
+    dest = cbz_path(path)
+    write_cbz(pages, dest, comic_info(title, number, volume_number, pages=len(pages)))
+    with zipfile.ZipFile(dest) as zf:
+        if len(zf.namelist()) != len(pages) + 1:
+            os.remove(dest)
+            raise OSError(f"{dest}: archive is missing pages")
+    shutil.rmtree(path)
+    from chapter_index import get_index
+
+    get_index().move(path.rstrip("/") + "/", dest)
+    return 1, size
+
+
+def convert_tree(root: str, dry_run: bool = False, workers: int = WORKERS):
+    start = time.monotonic()
+    converted = 0
+    total = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(convert_one, *job, dry_run): job[2] for job in chapter_dirs(root)}
+        for future, path in futures.items():
+            try:
+                n, size = future.result()
+                converted += n
+                total += size
+            except Exception as e:
+                failed.append((path, e))
+    return {"chapters": converted, "bytes": total, "failed": failed, "elapsed": time.monotonic() - start}
+
+
+if __name__ == "__main__":
+    from helper import MANGA_ROOT, colored
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args or args[0] != "convert":
+        print(__doc__)
+        sys.exit(1)
+    dry = "--dry-run" in sys.argv
+    result = convert_tree(args[1] if len(args) > 1 else MANGA_ROOT, dry_run=dry)
+    verb = "Would convert" if dry else "Converted"
+    print(
+        f"{verb} {colored(0,255,0,result['chapters'])} chapters ({result['bytes'] / 1048576:.1f} MB) "
+        f"in {result['elapsed']:.1f}s, {colored(255,0,0,len(result['failed']))} failed"
+    )
+    for path, error in result["failed"]:
+        print(f"  {path}: {error}")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import math
+import re
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+# Uploaders whose chapters just link out to another site.
+EXTERNAL_UPLOADERS = (
+    "MangaDex",
+    "comikey",
+    "NotXunder",
+    "AzukiTeam",
+    "inkrcomics",
+)
+
+_number = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(.*?)\s*$")
+
+
+def chapter_key(label: str):
+    """Sort key for a chapter label: "10" -> (10.0, ""), "10a" -> (10.0, "a"), "Extra" -> (inf, "extra")."""
+    if label and (
+        label.isdecimal() or label.replace(".", "", 1).isdecimal() and label[0] != "." and label[-1] != "."
+    ):
+        # Plain "10" or "10.5", nearly every label in a feed.
+        return float(label), ""
+    match = _number.match(label or "")
+    if match:
+        return float(match.group(1)), match.group(2).lower()
+    return math.inf, (label or "").strip().lower()
+
+
+def uploader_name(chapter):
+    return getattr(getattr(chapter, "uploader", None), "username", None)
+
+
+class ChapterCatalog:
+    """Chapters of one manga, filtered once and kept ordered by parsed chapter number.
+
+    Range and latest-chapter queries are bisects over the parsed keys rather than
+    re-scanning and re-parsing the whole list.
+    """
+
+    def __init__(
+        self,
+        chapters=(),
+        language: str = "en",
+        exclude_uploaders=EXTERNAL_UPLOADERS,
+        dedupe: bool = True,
+    ):
+        self.language = language
+        self.exclude_uploaders = set(exclude_uploaders)
+        self.dedupe = dedupe
+        exclude = self.exclude_uploaders
+        keyed = [
+            (chapter_key(chapter.chapter), chapter)
+            for chapter in chapters
+            if (not language or chapter.language == language)
+            and chapter.chapter
+            and getattr(chapter.uploader, "username", None) not in exclude
+        ]
+        # One stable sort, so the first chapter seen for a number stays first and dedupe keeps it.
+        keyed.sort(key=itemgetter(0))
+        self.keys = []
+        self.chapters = []
+        last = None
+        for key, chapter in keyed:
+            if dedupe and key == last:
+                continue
+            self.keys.append(key)
+            self.chapters.append(chapter)
+            last = key
+
+    def is_external(self, chapter) -> bool:
+        return uploader_name(chapter) in EXTERNAL_UPLOADERS
+
+    def range(self, start: float, end: float) -> list:
+        """Chapters numbered start..end inclusive; "10a" counts as inside a range ending at 10."""
+        lo = bisect_left(self.keys, (start,))
+        hi = bisect_right(self.keys, (end, "\U0010ffff"))
+        return self.chapters[lo:hi]
+
+    def latest(self):
+        """Highest numbered chapter, ignoring unnumbered extras; None when empty."""
+        i = bisect_left(self.keys, (math.inf,))
+        if i:
+            return self.chapters[i - 1]
+        return self.chapters[-1] if self.chapters else None
+
+    def __iter__(self):
+        return iter(self.chapters)
+
+    def __len__(self):
+        return len(self.chapters)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+INDEX_PATH = os.path.expanduser(os.getenv("MDEX_INDEX", "~/.cache/mdex_index.db"))
+
+
+class ChapterIndex:
+    """Local record of chapters already on the NAS so skip checks don't stat over the network."""
+
+    def __init__(self, path: str = INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS chapters (
+                path TEXT PRIMARY KEY,
+                manga_id TEXT,
+                chapter_id TEXT,
+                chapter TEXT,
+                added TEXT
+            )"""
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_manga_chapter ON chapters (manga_id, chapter_id, chapter)"
+        )
+        self.db.commit()
+
+    def has(self, manga_id: str, chapter_id: str, chapter: str, path: str, alt_path: str = None) -> bool:
+        """True if the chapter is recorded by id/number or under `path` (or `alt_path`, its other layout)."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT 1 FROM chapters WHERE path IN (?, ?) OR (manga_id = ? AND (chapter_id = ? OR chapter = ?)) LIMIT 1",
+                (path, alt_path or path, manga_id, chapter_id, chapter),
+            ).fetchone()
+        return row is not None
+
+    def add(self, manga_id: str, chapter_id: str, chapter: str, path: str):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO chapters VALUES (?, ?, ?, ?, ?)",
+                (path, manga_id, chapter_id, chapter, datetime.now(timezone.utc).isoformat()),
+            )
+            self.db.commit()
+
+    def remove(self, path: str):
+        with self.lock:
+            self.db.execute("DELETE FROM chapters WHERE path = ?", (path,))
+            self.db.commit()
+
+    def move(self, old_path: str, new_path: str):
+        with self.lock:
+            self.db.execute("UPDATE OR REPLACE chapters SET path = ? WHERE path = ?", (new_path, old_path))
+            self.db.commit()
+
+    def rebuild(self, root: str) -> int:
+        """Reconcile the index with {root}/{title}/{volume}/{chapter}/ (or {chapter}.cbz).
+
+        Rows under `root` whose path is no longer on disk are dropped, whoever wrote
+        them, so deleted chapters download again. Chapters found without a row are
+        added with unknown ids and match by path; existing rows keep their ids.
+        """
+        rows = []
+        for title in os.scandir(root):
+            if not title.is_dir():
+                continue
+            for volume in os.scandir(title.path):
+                if not volume.is_dir():
+                    continue
+                for chapter in os.scandir(volume.path):
+                    # Hidden ".name.part" directories are unfinished downloads.
+                    if chapter.name.startswith("."):
+                        continue
+                    number = chapter.name.split(" ", 1)[0]
+                    if chapter.is_dir():
+                        rows.append((chapter.path + "/", None, None, number, None))
+                    elif chapter.name.endswith(".cbz"):
+                        number = number[: -len(".cbz")] if number.endswith(".cbz") else number
+                        rows.append((chapter.path, None, None, number, None))
+        with self.lock:
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS scanned (path TEXT PRIMARY KEY)")
+            self.db.execute("DELETE FROM scanned")
+            self.db.executemany("INSERT OR IGNORE INTO scanned VALUES (?)", ((row[0],) for row in rows))
+            self.db.execute(
+                "DELETE FROM chapters WHERE substr(path, 1, ?) = ? AND path NOT IN (SELECT path FROM scanned)",
+                (len(root), root),
+            )
+            self.db.executemany("INSERT OR IGNORE INTO chapters VALUES (?, ?, ?, ?, ?)", rows)
+            self.db.execute("DELETE FROM scanned")
+            self.db.commit()
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> ChapterIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ChapterIndex()
+        return _index
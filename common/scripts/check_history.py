@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""History of manga_update checks, replacing the free-text manga_check.log.
+
+    check_history.py last TITLE [N]     last N chapters seen for TITLE
+    check_history.py silent [DAYS]      titles with no new chapter for DAYS (90)
+    check_history.py import [LOG]       import an old manga_check.log
+"""
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+from chapter_catalog import chapter_key
+
+HISTORY_PATH = os.path.expanduser(os.getenv("MDEX_HISTORY", "~/.cache/manga_history.db"))
+OLD_LOG = os.path.expanduser("~/.cache/manga_check.log")
+# "10-14-24 18:02:11: Title: 123, 10-14-24 21:58:40"; the title itself may contain ": ".
+_log_line = re.compile(
+    r"^(\d\d-\d\d-\d\d \d\d:\d\d:\d\d): (.*): (.*?), (\d\d-\d\d-\d\d \d\d:\d\d:\d\d|None)$"
+)
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class HistoryStore:
+    """SQLite (WAL) store of checks; rows are buffered and written in one transaction by flush()."""
+
+    def __init__(self, path: str = HISTORY_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS checks (
+                checked TEXT NOT NULL,
+                manga_id TEXT,
+                title TEXT NOT NULL,
+                chapter TEXT,
+                chapter_created TEXT
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_checks_title ON checks (title, checked)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_checks_time ON checks (checked)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_checks_manga ON checks (manga_id)")
+        self.db.commit()
+        self.pending = []
+
+    def record(self, manga_id, title, chapter, chapter_created, checked=None):
+        self.pending.append((checked or utc_now(), manga_id, title, chapter, chapter_created))
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        with self.db:
+            self.db.executemany("INSERT INTO checks VALUES (?, ?, ?, ?, ?)", self.pending)
+        written = len(self.pending)
+        self.pending = []
+        return written
+
+    def latest_chapter(self, manga_id: str):
+        """Highest chapter number ever recorded for `manga_id` (unflushed checks included), or None."""
+        labels = {row[3] for row in self.pending if row[1] == manga_id}
+        labels.update(
+            chapter
+            for (chapter,) in self.db.execute(
+                "SELECT DISTINCT chapter FROM checks WHERE manga_id = ?", (manga_id,)
+            )
+        )
+        labels.discard(None)
+        return max(labels, key=chapter_key, default=None)
+
+    def last_chapters(self, title: str, n: int = 10):
+        return self.db.execute(
+            """SELECT chapter, MAX(chapter_created), MIN(checked) FROM checks
+               WHERE title = ? GROUP BY chapter ORDER BY MIN(checked) DESC LIMIT ?""",
+            (title, n),
+        ).fetchall()
+
+    def silent_titles(self, days: int = 90):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat(timespec="seconds")
+        return self.db.execute(
+            """SELECT title, MAX(chapter_created) AS newest FROM checks
+               GROUP BY title HAVING newest < ? ORDER BY newest""",
+            (cutoff,),
+        ).fetchall()
+
+    def import_log(self, path: str = OLD_LOG):
+        """Load the old text log; its check times were written as UTC-4, chapter times as UTC."""
+        imported = 0
+        skipped = 0
+        with open(path) as f:
+            for line in f:
+                match = _log_line.match(line.rstrip("\n"))
+                if not match:
+                    skipped += 1
+                    continue
+                checked, title, chapter, created = match.groups()
+                checked = datetime.strptime(checked, "%m-%d-%y %H:%M:%S") + timedelta(hours=4)
+                if created != "None":
+                    created = (
+                        datetime.strptime(created, "%m-%d-%y %H:%M:%S")
+                        .replace(tzinfo=timezone.utc)
+                        .isoformat(timespec="seconds")
+                    )
+                else:
+                    created = None
+                self.record(
+                    None,
+                    title,
+                    chapter,
+                    created,
+                    checked.replace(tzinfo=timezone.utc).isoformat(timespec="seconds"),
+                )
+                imported += 1
+        self.flush()
+        return imported, skipped
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def main():
+    from helper import colored
+
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    store = HistoryStore()
+    command = sys.argv[1]
+    if command == "last" and len(sys.argv) > 2:
+        n = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+        for chapter, created, checked in store.last_chapters(sys.argv[2], n):
+            print(f"{colored(255,0,0,chapter)}: created {colored(0,0,255,created)}, first seen {checked}")
+    elif command == "silent":
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+        for title, newest in store.silent_titles(days):
+            print(f"{colored(0,255,0,title)}: last chapter {colored(0,0,255,newest)}")
+    elif command == "import":
+        imported, skipped = store.import_log(sys.argv[2] if len(sys.argv) > 2 else OLD_LOG)
+        print(f"Imported {colored(0,255,0,imported)} checks, skipped {skipped} unreadable lines")
+    else:
+        print(__doc__)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
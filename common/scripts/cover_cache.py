@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import threading
+import time
+
+import http_client
+
+CACHE_DIR = os.path.expanduser(os.getenv("MDEX_COVER_CACHE", "~/.cache/mdex_covers"))
+MAX_BYTES = int(os.getenv("MDEX_COVER_CACHE_MB", 200)) * 1024 * 1024
+# Covers rarely change; only ask the server again once an entry is this old.
+REVALIDATE_AFTER = int(os.getenv("MDEX_COVER_REVALIDATE", 24 * 60 * 60))
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+
+_lock = threading.Lock()
+
+
+def _load_index():
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_index(index):
+    tmp = f"{INDEX_PATH}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, INDEX_PATH)
+
+
+def _evict(index):
+    """Drop least recently used covers until the cache fits under MAX_BYTES."""
+    total = sum(entry["size"] for entry in index.values())
+    for key, entry in sorted(index.items(), key=lambda item: item[1]["used"]):
+        if total <= MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(CACHE_DIR, entry["file"]))
+        except FileNotFoundError:
+            pass
+        total -= entry["size"]
+        del index[key]
+
+
+def get_cover(url: str):
+    """Path to a local copy of `url`, downloading or revalidating it only when needed. None on failure."""
+    if not url:
+        return None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = hashlib.sha256(url.encode()).hexdigest()
+    ext = os.path.splitext(url.split("?", 1)[0])[1] or ".jpg"
+    with _lock:
+        index = _load_index()
+        entry = index.get(key)
+        path = os.path.join(CACHE_DIR, entry["file"] if entry else key + ext)
+        now = time.time()
+        if entry and os.path.exists(path) and now - entry["checked"] < REVALIDATE_AFTER:
+            entry["used"] = now
+            _save_index(index)
+            return path
+
+    headers = {}
+    if entry and os.path.exists(path):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    try:
+        r = http_client.get(url, headers=headers)
+    except Exception:
+        return path if entry and os.path.exists(path) else None
+
+    with _lock:
+        index = _load_index()
+        now = time.time()
+        if r.status_code == 304 and os.path.exists(path):
+            index.setdefault(key, entry)
+        elif r.status_code == 200:
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(r.content)
+            os.replace(tmp, path)
+            index[key] = {
+                "file": os.path.basename(path),
+                "url": url,
+                "size": len(r.content),
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+        else:
+            return path if os.path.exists(path) else None
+        index[key]["checked"] = now
+        index[key]["used"] = now
+        _evict(index)
+        _save_index(index)
+    return path if os.path.exists(path) else None
+
+
+def read_cover(url: str):
+    path = get_cover(url)
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
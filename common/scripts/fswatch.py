@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Minimal inotify over ctypes (no extra packages), plus the check for mounts inotify can't see into."""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+DIR_CHANGES = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+# Changes happen on servers for these; the local kernel never hears about them.
+NETWORK_FS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "fuse.sshfs", "fuse.rclone", "davfs", "afs", "ceph"}
+
+_event = struct.Struct("iIII")
+_libc = None
+
+
+def _lib():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+def mount_type(path: str) -> str:
+    """Filesystem type of the mount holding `path`, from /proc/mounts ("" when unknown)."""
+    path = os.path.realpath(path)
+    best, fstype = "", ""
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                mount = fields[1].replace("\\040", " ")
+                if (path == mount or path.startswith(mount.rstrip("/") + "/")) and len(mount) >= len(best):
+                    best, fstype = mount, fields[2]
+    except OSError:
+        pass
+    return fstype
+
+
+def usable(path: str) -> bool:
+    """Whether inotify on `path` will actually report changes."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        if not hasattr(_lib(), "inotify_init1"):
+            return False
+    except OSError:
+        return False
+    return mount_type(path) not in NETWORK_FS
+
+
+class Inotify:
+    def __init__(self):
+        self.fd = _lib().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths = {}
+
+    def add_watch(self, path: str, mask: int = DIR_CHANGES) -> int:
+        """Watch `path`; raises OSError (ENOSPC once fs.inotify.max_user_watches is used up)."""
+        wd = _lib().inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.paths[wd] = path
+        return wd
+
+    def read(self, timeout: float = None) -> list:
+        """[(watched path, mask, name)] for everything queued, waiting up to `timeout` seconds for the first.
+
+        A queue overflow comes through as (None, IN_Q_OVERFLOW, ""): events were lost, rescan everything.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = _event.unpack_from(buf, offset)
+                offset += _event.size
+                name = buf[offset : offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+                offset += length
+                path = self.paths.get(wd)
+                if mask & IN_IGNORED:
+                    self.paths.pop(wd, None)
+                if path is not None or mask & IN_Q_OVERFLOW:
+                    events.append((path, mask, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def watch_limit_hit(error: OSError) -> bool:
+    return error.errno == errno.ENOSPC
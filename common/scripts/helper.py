@@ -1,24 +1,50 @@
-import requests
+import http_client
+import metrics
+import MangaDexPy
 import os
-import shutil
 from datetime import datetime, timedelta, timezone
-from MangaDexPy import downloader
-import subprocess
+import page_downloader
+import bandwidth
+import cbz
+import pruner
 import re
-import contextlib
 from alive_progress import alive_bar
+from chapter_index import get_index
+from cover_cache import read_cover
 import base64
+import json
+import time
 
 
-def download_chapters(sorted_chapters: list, manga, overwrite=False):
+MANGA_ROOT = os.getenv("MANGA_ROOT", "/mnt/NAS/Manga/")
+API_URL = os.getenv("MDEX_API", "https://api.mangadex.org")
+# The custom list that holds every followed title.
+MDLIST_ID = "fcf0cb49-964b-4aec-8f23-40c6e3524b7c"
+# "dir" keeps loose pages per chapter, "cbz" writes one stored archive per chapter.
+STORAGE = os.getenv("MDEX_STORAGE", "dir")
+
+
+def download_chapters(
+    sorted_chapters: list, manga, overwrite=False, show_bar=True, storage=None
+):
+    storage = storage or STORAGE
     # name_manga = f"{manga.title['en']}"
     try:
         name_manga = manga.title["en"]
     except KeyError as e:
         name_manga = manga.title["ja-ro"]
+    try:
+        writer = manga.author[0].name
+    except (IndexError, AttributeError):
+        writer = None
     new_chapters = 0
-    with alive_bar(len(sorted_chapters), title=name_manga) as bar:
-        for chapter in sorted_chapters:
+    index = get_index()
+    totals = {"pages": 0, "bytes": 0, "elapsed": 0.0, "latencies": [], "saved": 0}
+    with alive_bar(
+        len(sorted_chapters), title=name_manga, disable=not show_bar
+    ) as bar:
+        # Newly released chapters go first, and outrank other titles' backfill for bandwidth.
+        for chapter in sorted(sorted_chapters, key=bandwidth.chapter_priority):
             if chapter.title is None:
                 chapter.title = ""
 
@@ -35,31 +61,90 @@ def download_chapters(sorted_chapters: list, manga, overwrite=False):
             # bar.text(colored(0, 255, 0, "Now downloading chapter..."))
             if chapter.title:
                 path_loc = (
-                    f"/mnt/NAS/Manga/{m_title}/{volume}/{chapter.chapter} {title}/"
+                    f"{MANGA_ROOT}{m_title}/{volume}/{chapter.chapter} {title}/"
                 )
             else:
-                path_loc = f"/mnt/NAS/Manga/{m_title}/{volume}/{chapter.chapter}/"
+                path_loc = f"{MANGA_ROOT}{m_title}/{volume}/{chapter.chapter}/"
             # if "'" in path_loc or '"' in path_loc:
             #     path_loc = f"/mnt/NAS/Manga/{manga.title['en']}/{chapter.chapter}"
-            if not overwrite and os.path.exists(path_loc):
+            archive = cbz.cbz_path(path_loc)
+            stored_at = archive if storage == "cbz" else path_loc
+            with metrics.span("index_lookup"):
+                indexed = not overwrite and index.has(
+                    manga.id, chapter.id, chapter.chapter, path_loc, archive
+                )
+            if indexed:
                 pass
+            elif not overwrite and (os.path.exists(path_loc) or os.path.exists(archive)):
+                # Downloaded before the index existed; remember it so we never stat it again.
+                existing = path_loc if os.path.exists(path_loc) else archive
+                index.add(manga.id, chapter.id, chapter.chapter, existing)
             else:
-                os.system(f"""mkdir -p \"{path_loc}\"""")
-                with contextlib.redirect_stdout(None):
-                    try:
-                        downloader.threaded_dl_chapter(chapter, path_loc, light=False)
-                        new_chapters += 1
-                        already_done.append(str(chapter.chapter))
-                    except Exception as e:
-                        print("An API error occurred with status code:", e)
+                try:
+                    stats = page_downloader.download_chapter(
+                        chapter,
+                        path_loc,
+                        light=False,
+                        overwrite=overwrite,
+                        progress=lambda st: bar.text(
+                            f" Chapter {chapter.chapter}: {title} {page_stats(st)}"
+                        ),
+                        storage=storage,
+                        priority=bandwidth.chapter_priority(chapter),
+                        info={
+                            "series": name_manga,
+                            "volume": chapter.volume,
+                            "title": chapter.title,
+                            "writer": writer,
+                            "web": f"https://mangadex.org/chapter/{chapter.id}",
+                        },
+                    )
+                    for key in ("pages", "bytes", "elapsed", "saved"):
+                        totals[key] += stats[key]
+                    totals["latencies"].extend(stats["latencies"])
+                    index.add(manga.id, chapter.id, chapter.chapter, stored_at)
+                    new_chapters += 1
+                    already_done.append(str(chapter.chapter))
+                except page_downloader.IncompleteChapter as e:
+                    print(colored(255, 0, 0, f"Chapter {chapter.chapter} incomplete, will resume next run: {e}"))
+                except Exception as e:
+                    print("An API error occurred with status code:", e)
             bar()
     print(
         colored(255, 165, 0, "New Chapters Downloaded:"),
         colored(0, 255, 0, f"{new_chapters}"),
     )
+    if totals["pages"]:
+        print(colored(255, 165, 0, "Pages:"), colored(0, 255, 0, page_stats(totals)))
+    if totals["saved"]:
+        print(
+            colored(255, 165, 0, "Transcoding saved:"),
+            colored(0, 255, 0, f"{totals['saved'] / 1048576:.1f} MB ({totals['saved'] / totals['bytes']:.0%})"),
+        )
     return new_chapters, name_manga
 
 
+def page_stats(stats: dict):
+    """One-line summary of page download stats: size, throughput and median page latency."""
+    elapsed = stats["elapsed"] or 1e-9
+    latencies = sorted(stats["latencies"])
+    median = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    return (
+        f"{stats['pages']} pages, {stats['bytes'] / 1048576:.1f} MB, "
+        f"{stats['pages'] / elapsed:.1f} pages/s, {stats['bytes'] / 1048576 / elapsed:.2f} MB/s, "
+        f"p50 {median:.0f} ms"
+    )
+
+
+def new_client():
+    """MangaDexPy client pointed at API_URL (the wrapper keeps its base URL in `.api`)."""
+    cli = MangaDexPy.MangaDex()
+    cli.api = API_URL
+    # The wrapper's own requests (feed pages included) share the pooled, rate-limited session.
+    cli.session = http_client.session()
+    return cli
+
+
 def check_recent(timestamp, offset: int = 5):
     input_time = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z")
     current_time = datetime.now(input_time.tzinfo)
@@ -70,8 +155,8 @@ def check_recent(timestamp, offset: int = 5):
 
 
 def pull_externalURL(chapter_id: str):
-    base_url = "https://api.mangadex.org"
-    r = requests.get(f"{base_url}/chapter/{chapter_id}")
+    base_url = API_URL
+    r = http_client.get(f"{base_url}/chapter/{chapter_id}")
     return r.json()["data"]["attributes"]["externalUrl"]
 
 
@@ -93,19 +178,16 @@ def colored(r: int, g: int, b: int, text: str):
     return "\033[38;2;{};{};{}m{}\033[38;2;255;255;255m".format(r, g, b, text)
 
 
-def clean_up_parents(directory):
-    delete_empty_parents = ['fd', '-tf', '-te', '-a', '.', f'{directory}', '-X', 'rm', '-rf', '{//}']
-    delete_empty_dirs = ['fd', '-td', '-te', '-a', '.', f'{directory}', '-X', 'rm', '-rf']
-    try:
-        subprocess.run(delete_empty_parents, check=True)
-        print("Deleted empties successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}")
-    try:
-        subprocess.run(delete_empty_parents, check=True)
-        print("Extra check completed successfully")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}")
+def clean_up_parents(directory, dry_run=False, touched_only=False):
+    since = pruner.last_run() if touched_only else None
+    result = pruner.prune(directory, dry_run=dry_run, since=since)
+    verb = "Would remove" if dry_run else "Removed"
+    print(
+        f"{verb} {colored(0,255,0,result['files'])} empty files and {colored(0,255,0,result['dirs'])} directories "
+        f"({colored(255,0,0,result['broken_chapters'])} broken chapters) across {result['titles']} titles "
+        f"in {result['elapsed']:.2f}s"
+    )
+    return result
 
 
 def get_manga_title(result):
@@ -137,11 +219,12 @@ class DiscordWebHook:
 
         files = None
         if image_url:
-            image_data = requests.get(image_url)
-            if image_data.status_code == 200:
-                files = {"file": ("image.jpg", image_data.content)}
+            image_data = read_cover(image_url)
+            if image_data is not None:
+                files = {"file": ("image.jpg", image_data)}
 
-        response = requests.post(self.webhook_url, data=data, files=files)
+        # No transport-level retries: a 5xx may still have posted, and NotificationQueue handles 429s itself.
+        response = http_client.post(self.webhook_url, data=data, files=files, retries=0)
 
         if 200 <= response.status_code < 300:
             # print("Webhook message sent successfully!")
@@ -149,6 +232,7 @@ class DiscordWebHook:
         else:
             print("Failed to send webhook message.")
             print("Response:", response.status_code, response.text)
+        return response
 
 
 if __name__ == "__main__":
@@ -159,29 +243,104 @@ if __name__ == "__main__":
     )
 
 
-def get_mdlist():
-    base_url = "https://api.mangadex.org"
+TOKEN_PATH = os.path.expanduser("~/.cache/mdex_token.json")
+LIST_CACHE_PATH = os.path.expanduser("~/.cache/mdex_list.json")
+LIST_TTL = int(os.getenv("MDEX_LIST_TTL", 300))
+SESSION_TTL = 14 * 60  # session tokens last 15 minutes, renew a little early
+REFRESH_TTL = 29 * 24 * 60 * 60  # refresh tokens last a month
+
+
+def read_json(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_private_json(path: str, data):
+    """Write JSON readable only by us; goes through a temp file so a crash can't leave it half written."""
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, path)
+
+
+def mdex_login(base_url: str):
     creds = {
         "username": "USER_NAME",
         "password": "password",  # I don't really care. I'm sure this is out there in the dataleak anyway, lolol.
     }
-    r = requests.post(f"{base_url}/auth/login", json=creds)
+    r = http_client.post(f"{base_url}/auth/login", json=creds)
     r_json = r.json()
+    now = time.time()
+    return {
+        "session": r_json["token"]["session"],
+        "refresh": r_json["token"]["refresh"],
+        "session_expires": now + SESSION_TTL,
+        "refresh_expires": now + REFRESH_TTL,
+    }
 
-    session_tkn = r_json["token"]["session"]
-    # expires = datetime.now().timestamp() + 15 * 60000
-    # refresh_token = r_json["token"]["refresh"]
 
-    base_url = "https://api.mangadex.org"
-    list_id = "fcf0cb49-964b-4aec-8f23-40c6e3524b7c"
-    r = requests.get(
-        f"{base_url}/list/{list_id}",
-        headers={"Authorization": f"Bearer {session_tkn}"},
-    )
+def mdex_refresh(base_url: str, tokens: dict):
+    r = http_client.post(f"{base_url}/auth/refresh", json={"token": tokens["refresh"]})
+    if r.status_code != 200 or r.json().get("result") != "ok":
+        return None
+    r_json = r.json()
+    tokens["session"] = r_json["token"]["session"]
+    tokens["session_expires"] = time.time() + SESSION_TTL
+    if r_json["token"].get("refresh"):
+        tokens["refresh"] = r_json["token"]["refresh"]
+    return tokens
+
+
+def get_session_token(base_url: str = API_URL):
+    """Cached session token: reuse it, renew it with the refresh token, and only log in as a last resort."""
+    tokens = read_json(TOKEN_PATH)
+    now = time.time()
+    if tokens and tokens["session_expires"] > now:
+        return tokens["session"]
+    if tokens and tokens["refresh_expires"] > now:
+        tokens = mdex_refresh(base_url, tokens)
+    else:
+        tokens = None
+    if tokens is None:
+        tokens = mdex_login(base_url)
+    write_private_json(TOKEN_PATH, tokens)
+    return tokens["session"]
+
+
+def get_mdlist():
+    base_url = API_URL
+    list_id = MDLIST_ID
+    cached = read_json(LIST_CACHE_PATH)
+    if cached and cached["list_id"] == list_id and time.time() - cached["fetched"] < LIST_TTL:
+        return cached["manga_ids"]
+
+    with metrics.span("login"):
+        session_tkn = get_session_token(base_url)
+    with metrics.span("list_fetch"):
+        r = http_client.get(
+            f"{base_url}/list/{list_id}",
+            headers={"Authorization": f"Bearer {session_tkn}"},
+        )
+    if r.status_code == 401:
+        # Token was revoked server side; forget it and log in fresh.
+        os.remove(TOKEN_PATH)
+        session_tkn = get_session_token(base_url)
+        r = http_client.get(
+            f"{base_url}/list/{list_id}",
+            headers={"Authorization": f"Bearer {session_tkn}"},
+        )
 
     manga_ids = [
         relationship["id"]
         for relationship in r.json()["data"]["relationships"]
         if relationship["type"] == "manga"
     ]
+    write_private_json(
+        LIST_CACHE_PATH, {"list_id": list_id, "fetched": time.time(), "manga_ids": manga_ids}
+    )
     return manga_ids
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import os
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+    float(os.getenv("HTTP_READ_TIMEOUT", 30)),
+)
+MAX_RETRIES = int(os.getenv("HTTP_RETRIES", 4))
+BACKOFF = 0.5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MDEX_API = os.getenv("MDEX_API", "https://api.mangadex.org")
+
+_session = None
+_session_lock = threading.Lock()
+_counter_lock = threading.Lock()
+# host -> number of requests/retries/failures, for end-of-run reporting
+requests_per_host = Counter()
+retries_per_host = Counter()
+failures_per_host = Counter()
+
+
+class RateLimiter:
+    """Token bucket shared between threads so concurrent titles stay under MangaDex's per-IP limit."""
+
+    def __init__(self, rate: float = 5, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.rate, self.tokens + (now - self.last) * self.rate / self.per
+                )
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.per / self.rate
+            time.sleep(wait)
+
+
+# MangaDex allows roughly 5 requests per second per IP, and 40 per minute to /at-home/server on top of that.
+API_LIMITER = RateLimiter(rate=float(os.getenv("MDEX_RATE", 5)))
+AT_HOME_LIMITER = RateLimiter(rate=float(os.getenv("MDEX_AT_HOME_RATE", 40)), per=60.0)
+
+
+def limiters_for(url: str) -> list:
+    parts = urlsplit(url)
+    if parts.netloc != urlsplit(MDEX_API).netloc:
+        return []
+    if parts.path.startswith("/at-home/server"):
+        return [API_LIMITER, AT_HOME_LIMITER]
+    return [API_LIMITER]
+
+
+class LimitedSession(requests.Session):
+    """Session with a default timeout, backoff on 429/5xx/connection errors, and the MangaDex rate
+    limits waited on before every attempt. MangaDexPy clients use it too, so their requests get the same treatment."""
+
+    def request(self, method, url, *args, retries: int = MAX_RETRIES, **kwargs):
+        kwargs.setdefault("timeout", TIMEOUT)
+        host = urlsplit(url).netloc
+        for attempt in range(retries + 1):
+            with _counter_lock:
+                requests_per_host[host] += 1
+            response = None
+            try:
+                for limiter in limiters_for(url):
+                    limiter.acquire()
+                response = super().request(method, url, *args, **kwargs)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == retries:
+                    with _counter_lock:
+                        failures_per_host[host] += 1
+                    raise
+            if attempt == retries:
+                break
+            with _counter_lock:
+                retries_per_host[host] += 1
+            delay = retry_after(response, attempt)
+            if response is not None:
+                # Hand the connection back to the pool before sleeping on it.
+                response.close()
+            time.sleep(delay)
+        with _counter_lock:
+            failures_per_host[host] += 1
+        return response
+
+
+def session() -> requests.Session:
+    """One keep-alive Session for the whole process; urllib3 keeps a pool per host under it."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = LimitedSession()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def retry_after(response, attempt: int) -> float:
+    header = response.headers.get("Retry-After") if response is not None else None
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(header)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return BACKOFF * 2**attempt + random.uniform(0, BACKOFF)
+
+
+def request(method: str, url: str, retries: int = MAX_RETRIES, **kwargs) -> requests.Response:
+    """requests.request with pooling, a default timeout and backoff on 429/5xx/connection errors."""
+    return session().request(method, url, retries=retries, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def api_requests() -> int:
+    """Requests sent to the MangaDex API host so far, retries included."""
+    with _counter_lock:
+        return requests_per_host[urlsplit(MDEX_API).netloc]
+
+
+def stats() -> dict:
+    with _counter_lock:
+        return {
+            host: {
+                "requests": requests_per_host[host],
+                "retries": retries_per_host[host],
+                "failures": failures_per_host[host],
+            }
+            for host in requests_per_host
+        }
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
+import io
+import os
 import re
+import sys
+import time
 from pathlib import Path
 from sys import platform
+from typing import NamedTuple
+from xml.etree import ElementTree
+from xml.parsers import expat
 
 re_syn = r"^.*(\d+\.\d+)% Giliath  Osborne$"
+# --watch: seconds of quiet after the game's last write before re-parsing, and the poll interval without inotify.
+DEBOUNCE = float(os.getenv("HUNT_DEBOUNCE", 1.0))
+POLL = float(os.getenv("HUNT_POLL", 2.0))
 
 from sys import platform
 
@@ -50,17 +60,170 @@ class colors:
         lightgrey = "\033[47m"
 
 
-def parse_stats():
-    with open(path, "r") as f:
-        dictos = {}
-        for i in f.readlines():
-            if "blood_line_name" in i:
-                # print(re.search(r'value="(.*?)"', i).group(1).rstrip()+"\'s MMR is: ", end="")
-                name = re.search(r'value="(.*?)"', i).group(1).rstrip()
-            if "mmr" in i and "MissionBagPlayer" in i and "ui_mmr" not in i:
-                mmr = re.search(r'value="(.*?)"', i).group(1)
-                dictos[name] = mmr
-    return dictos
+class Player(NamedTuple):
+    name: str
+    mmr: int
+    team: int
+    own_team: bool
+
+
+class Team(NamedTuple):
+    index: int
+    mmr: int
+    own: bool
+    players: list
+
+
+# MissionBagPlayer_{team}_{slot}_{field} / MissionBagTeam_{team}_{field}
+_player_attr = re.compile(r"^MissionBagPlayer_(\d+)_(\d+)_(blood_line_name|mmr)$")
+_team_attr = re.compile(r"^MissionBagTeam_(\d+)_(mmr|numplayers|ownteam)$")
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _RootOpened(Exception):
+    pass
+
+
+def root_start_end(data: bytes) -> int:
+    """Offset just past the root element's start tag, as expat sees it."""
+    parser = expat.ParserCreate()
+    opened = []
+
+    def event(*_):
+        if opened:
+            raise _RootOpened(parser.CurrentByteIndex)
+
+    def start(*_):
+        event()
+        opened.append(True)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = parser.CharacterDataHandler = event
+    parser.CommentHandler = parser.ProcessingInstructionHandler = event
+    try:
+        for offset in range(0, len(data), 1 << 16):
+            parser.Parse(data[offset : offset + (1 << 16)], False)
+        parser.Parse(b"", True)
+    except _RootOpened as e:
+        return e.args[0]
+    except expat.ExpatError as e:
+        raise ElementTree.ParseError(str(e)) from None
+    raise ElementTree.ParseError("attributes.xml has no root element")
+
+
+def mission_bag_lines(data: bytes) -> list:
+    """(name, value) of the MissionBag attributes, parsing only the lines that mention them.
+
+    The document handed to ElementTree is the file's prolog and root start tag,
+    every line containing "MissionBag", and the file's last line, so a file the
+    game is still writing (no closing root tag) fails to parse. An element split
+    over lines fails the same way; the caller then parses the whole file.
+    """
+    body = root_start_end(data)
+    end = len(data)
+    while end and data[end - 1 : end].isspace():
+        end -= 1
+    last = data.rfind(b"\n", 0, end) + 1
+    if last <= body:
+        lines = [data[body:]]
+    else:
+        lines = []
+        pos = body
+        while (hit := data.find(b"MissionBag", pos, last)) != -1:
+            start = max(data.rfind(b"\n", 0, hit) + 1, body)
+            end = data.find(b"\n", hit, last)
+            pos = last if end == -1 else end + 1
+            lines.append(data[start:pos])
+        lines.append(data[last:])
+    root = ElementTree.fromstring(data[:body] + b"".join(lines))
+    attrs = []
+    for elem in root.iter():
+        name = elem.get("name") or ""
+        if elem is not root and name.startswith("MissionBag"):
+            attrs.append((name, elem.get("value")))
+    return attrs
+
+
+def mission_bag_iterparse(source) -> list:
+    """(name, value) of the MissionBag attributes from a full streaming parse of the file."""
+    attrs = []
+    # Attr elements are empty, so their attributes are complete at "start"; no need for "end" events.
+    context = ElementTree.iterparse(source, events=("start",))
+    _, root = next(context)
+    for count, (_, elem) in enumerate(context):
+        if count % 1024 == 0:
+            root.clear()
+        name = elem.get("name") or ""
+        if name.startswith("MissionBag"):
+            attrs.append((name, elem.get("value")))
+    return attrs
+
+
+def mission_bag_attrs(source) -> list:
+    """(name, value) of every MissionBag attribute in attributes.xml.
+
+    The line-filtered parse covers the file as the game writes it (one Attr per
+    line); anything it can't parse gets the full iterparse, which has the final
+    say and raises ElementTree.ParseError on a file that is still being written.
+    """
+    with open(source, "rb") as f:
+        data = f.read()
+    try:
+        return mission_bag_lines(data)
+    except ElementTree.ParseError:
+        return mission_bag_iterparse(io.BytesIO(data))
+
+
+def parse_roster(source=None) -> list:
+    """Teams of the last match from attributes.xml.
+
+    Only the lines holding MissionBag attributes are parsed when the layout
+    allows it (see mission_bag_attrs), so a profile full of unrelated
+    attributes costs little more than reading it. The game leaves older, larger matches' slots in the
+    file; anything past MissionBagNumTeams or a team's numplayers is ignored.
+    Players without a name or a numeric MMR are skipped. A file the game is
+    still writing raises ElementTree.ParseError.
+    """
+    players = {}
+    teams = {}
+    num_teams = None
+    for name, value in mission_bag_attrs(source or path):
+        if name == "MissionBagNumTeams":
+            num_teams = to_int(value)
+        elif match := _player_attr.match(name):
+            team, slot, field = match.groups()
+            players.setdefault((int(team), int(slot)), {})[field] = value
+        elif match := _team_attr.match(name):
+            team, field = match.groups()
+            teams.setdefault(int(team), {})[field] = value
+    roster = []
+    for index in sorted(set(teams) | {team for team, _ in players}):
+        if num_teams is not None and index >= num_teams:
+            continue
+        info = teams.get(index, {})
+        own = (info.get("ownteam") or "").lower() == "true"
+        size = to_int(info.get("numplayers"))
+        members = []
+        for (team, slot), fields in sorted(players.items()):
+            if team != index or (size is not None and slot >= size):
+                continue
+            name = (fields.get("blood_line_name") or "").rstrip()
+            mmr = to_int(fields.get("mmr"))
+            if name and mmr is not None:
+                members.append(Player(name, mmr, index, own))
+        roster.append(Team(index, to_int(info.get("mmr")) or 0, own, members))
+    return roster
+
+
+def parse_stats(source=None):
+    """{player name: MMR string} for prettify(), as the old line-by-line regex parser returned it."""
+    return {p.name: str(p.mmr) for team in parse_roster(source) for p in team.players}
 
 
 def sort_dict(d):
@@ -112,4 +275,83 @@ def prettify(d):
             )
 
 
-prettify(sort_dict(parse_stats()))
+def file_state(source):
+    try:
+        st = os.stat(source)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def wait_for_change(source, last_state, watcher=None):
+    """Block until `source` has changed and then stayed quiet for DEBOUNCE seconds; returns its new state."""
+    name = os.path.basename(source)
+    while True:
+        if watcher:
+            if not any(n == name for _, _, n in watcher.read()):
+                continue
+            # The game writes the profile in bursts; wait until it has gone quiet.
+            while any(n == name for _, _, n in watcher.read(DEBOUNCE)):
+                pass
+        else:
+            time.sleep(POLL)
+            state = file_state(source)
+            if state == last_state:
+                continue
+            while True:
+                time.sleep(DEBOUNCE)
+                settled = file_state(source)
+                if settled == state:
+                    break
+                state = settled
+        state = file_state(source)
+        if state is not None and state != last_state:
+            return state
+
+
+def draw(roster):
+    players = {p.name: str(p.mmr) for team in roster for p in team.players}
+    # Home the cursor and clear the screen, so the table is replaced rather than scrolled.
+    print("\033[H\033[2J", end="")
+    prettify(sort_dict(players))
+    sys.stdout.flush()
+
+
+def watch(source=None):
+    """Redraw the MMR table each time the game rewrites attributes.xml with a different roster."""
+    import fswatch
+
+    source = str(source or path)
+    watcher = None
+    if fswatch.usable(os.path.dirname(source)):
+        watcher = fswatch.Inotify()
+        # Watch the directory: the game may replace the file rather than rewrite it in place.
+        watcher.add_watch(
+            os.path.dirname(source),
+            fswatch.IN_CLOSE_WRITE | fswatch.IN_MOVED_TO | fswatch.IN_CREATE | fswatch.IN_MODIFY,
+        )
+    state = file_state(source)
+    shown = None
+    try:
+        while True:
+            try:
+                roster = parse_roster(source) if state else None
+            except ElementTree.ParseError:
+                roster = shown  # caught the game mid-write; the next change event will bring the rest
+            if roster is not None and roster != shown:
+                draw(roster)
+                shown = roster
+            state = wait_for_change(source, state, watcher)
+    finally:
+        if watcher:
+            watcher.close()
+
+
+if __name__ == "__main__":
+    if "--watch" in sys.argv:
+        try:
+            watch()
+        except KeyboardInterrupt:
+            pass
+    else:
+        prettify(sort_dict(parse_stats()))
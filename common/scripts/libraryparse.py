@@ -1,8 +1,32 @@
 #!/usr/bin/env python3
+"""Seasons/Episodes/Specials per show under the anime library.
+
+    libraryparse.py [--json] [--no-cache] [ROOT]
+    libraryparse.py --daemon [ROOT]     keep the index current and serve it
+    libraryparse.py --query [SHOW]      ask the daemon (totals and every show, or one show)
+"""
+import json
 import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fswatch
 
 # Specify the root directory
 root_directory = "/mnt/NAS/Anime/"
+CACHE_PATH = os.path.expanduser(os.getenv("LIBRARY_CACHE", "~/.cache/anime_library.json"))
+# Network mounts answer one request at a time per thread; more threads means more round trips in flight.
+WORKERS = int(os.getenv("LIBRARY_WORKERS", 16))
+SOCKET_PATH = os.path.expanduser(os.getenv("LIBRARY_SOCKET", "~/.cache/anime_library.sock"))
+SNAPSHOT_PATH = os.path.expanduser(os.getenv("LIBRARY_SNAPSHOT", "~/.cache/anime_library_snapshot.json"))
+# Seconds between mtime-diff rescans when inotify can't see the library (network mounts).
+POLL_INTERVAL = int(os.getenv("LIBRARY_POLL", 60))
+# Events are collected this long before the touched shows are re-read.
+SETTLE = float(os.getenv("LIBRARY_SETTLE", 1.0))
 
 
 def colored(r, g, b, text):
@@ -14,6 +38,42 @@ def get_dir_info(root_directory):
     return subdirectories, subfiles
 
 
+def list_dir(path: str):
+    """One listing of `path`: (mtime_ns, [subdirectory names], number of files), in os.walk's order."""
+    # Stat before listing: a change that lands mid-listing then shows up as a new mtime next run.
+    mtime = os.stat(path).st_mtime_ns
+    dirs = []
+    files = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry.name)
+            else:
+                files += 1
+    return mtime, dirs, files
+
+
+def summarize(subdirs: list, files: int):
+    """Seasons/Episodes/Specials from a show's listing; `subdirs` is [(name, file count)] in listing order."""
+    episodes = 0
+    specials = 0
+    seasons = 0  # Count of seasons without "0"
+    for season, count in subdirs:
+        if "Season" in season and "0" not in season:
+            seasons += 1
+            episodes += count
+        else:
+            specials = count
+    if seasons == 0:
+        seasons = 1
+        episodes = files
+    return {"Seasons": seasons, "Episodes": episodes, "Specials": specials}
+
+
 class LibraryParser:
     def __init__(self, directory: str):
         self.path = root_directory + directory
@@ -39,18 +99,226 @@ class LibraryParser:
         return seasons, episodes, specials
 
 
-if __name__ == "__main__":
-    subdirs, _ = get_dir_info(root_directory)
-    library_dict = {}
-
-    for subdir in subdirs:
-        subdir_class = LibraryParser(subdir)
-        seasons, season_episodes, specials = subdir_class.parse_animes()
-        library_dict[subdir] = {
-            "Seasons": seasons,
-            "Episodes": season_episodes["total_episodes"],
-            "Specials": specials,
-        }
+class LibraryScanner:
+    """Parallel scan of every show, re-listing only directories whose mtime moved since the last run.
+
+    The cache maps each show path to its mtime, file count and, per subdirectory,
+    the subdirectory's own mtime and file count. A new episode only touches its
+    season directory, so an unchanged show costs one stat per directory and no listings.
+    """
+
+    def __init__(self, root: str = root_directory, cache_path: str = CACHE_PATH, workers: int = WORKERS):
+        self.root = root
+        self.cache_path = cache_path
+        self.workers = workers
+        self.cache = {}
+        if cache_path:
+            try:
+                with open(cache_path) as f:
+                    self.cache = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        self.lock = threading.Lock()
+        self.listed = 0
+        self.reused = 0
+        self.library = {}
+
+    def scan_show(self, path: str):
+        cached = self.cache.get(path)
+        listed = 0
+        mtime = os.stat(path).st_mtime_ns
+        if cached and cached["mtime"] == mtime:
+            files = cached["files"]
+            names = [name for name, _, _ in cached["dirs"]]
+        else:
+            mtime, names, files = list_dir(path)
+            listed += 1
+        old = {name: (m, count) for name, m, count in cached["dirs"]} if cached else {}
+        dirs = []
+        for name in names:
+            sub = os.path.join(path, name)
+            try:
+                sub_mtime = os.stat(sub).st_mtime_ns
+                if name in old and old[name][0] == sub_mtime:
+                    count = old[name][1]
+                else:
+                    sub_mtime, _, count = list_dir(sub)
+                    listed += 1
+            except FileNotFoundError:
+                continue  # removed since the show was listed
+            dirs.append([name, sub_mtime, count])
+        entry = {"mtime": mtime, "files": files, "dirs": dirs}
+        with self.lock:
+            self.listed += listed
+            self.reused += listed == 0
+        return entry
+
+    def scan(self) -> dict:
+        """{show: {"Seasons", "Episodes", "Specials"}} in the root's listing order, as the old report printed it."""
+        _, shows, _ = list_dir(self.root)
+        paths = [os.path.join(self.root, show) for show in shows]
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            entries = list(pool.map(self.scan_show, paths))
+        self.cache = dict(zip(paths, entries))
+        self.save()
+        self.library = {show: self.summarize(entry) for show, entry in zip(shows, entries)}
+        return self.library
+
+    @staticmethod
+    def summarize(entry: dict):
+        return summarize([(name, count) for name, _, count in entry["dirs"]], entry["files"])
+
+    def update(self, show: str) -> bool:
+        """Re-read one show after a change event; returns whether its counts changed (or it came or went)."""
+        path = os.path.join(self.root, show)
+        try:
+            entry = self.scan_show(path) if os.path.isdir(path) else None
+        except FileNotFoundError:
+            entry = None
+        if entry is None:
+            self.cache.pop(path, None)
+            return self.library.pop(show, None) is not None
+        self.cache[path] = entry
+        info = self.summarize(entry)
+        changed = self.library.get(show) != info
+        self.library[show] = info
+        return changed
+
+    def snapshot(self) -> dict:
+        totals = {"Shows": len(self.library)}
+        for key in ("Seasons", "Episodes", "Specials"):
+            totals[key] = sum(info[key] for info in self.library.values())
+        return {"updated": time.time(), "totals": totals, "library": self.library}
+
+    def save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.cache, f)
+        os.replace(tmp, self.cache_path)
+
+
+def write_snapshot(scanner: LibraryScanner) -> dict:
+    snapshot = scanner.snapshot()
+    tmp = f"{SNAPSHOT_PATH}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, SNAPSHOT_PATH)
+    return snapshot
+
+
+def serve(scanner: LibraryScanner, lock: threading.Lock):
+    """Answer one request line per connection: empty for the whole snapshot, or a show name."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            show = self.rfile.readline().decode().strip()
+            with lock:
+                reply = scanner.snapshot() if not show else scanner.library.get(show)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+    server = socketserver.ThreadingUnixStreamServer(SOCKET_PATH, Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def query(show: str = "", path: str = SOCKET_PATH):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(show.encode() + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def watch_library(watcher: fswatch.Inotify, root: str, shows) -> bool:
+    """Watch the root, each show and each season; False once the kernel's watch limit is reached."""
+    try:
+        watcher.add_watch(root)
+        for show in shows:
+            watch_show(watcher, os.path.join(root, show))
+    except OSError as e:
+        if fswatch.watch_limit_hit(e):
+            return False
+        raise
+    return True
+
+
+def watch_show(watcher: fswatch.Inotify, path: str):
+    try:
+        watcher.add_watch(path)
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    watcher.add_watch(entry.path)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+
+
+def run_daemon(root: str = root_directory):
+    """Scan once, then keep the index current from inotify events (or mtime polling) until killed."""
+    root = root.rstrip("/") + "/"
+    scanner = LibraryScanner(root)
+    lock = threading.Lock()
+    with lock:
+        scanner.scan()
+        write_snapshot(scanner)
+    server = serve(scanner, lock)
+    watcher = None
+    if fswatch.usable(root):
+        watcher = fswatch.Inotify()
+        if not watch_library(watcher, root, scanner.library):
+            print("inotify watch limit reached (fs.inotify.max_user_watches), polling instead")
+            watcher.close()
+            watcher = None
+    mode = "inotify" if watcher else f"polling every {POLL_INTERVAL}s"
+    print(f"Watching {colored(0,255,0,len(scanner.library))} shows under {root} ({mode}), socket {SOCKET_PATH}")
+    try:
+        while True:
+            if watcher is None:
+                time.sleep(POLL_INTERVAL)
+                # scan() swaps in a new dict when it's done, so queries keep being answered meanwhile.
+                before = scanner.library
+                if scanner.scan() != before:
+                    with lock:
+                        write_snapshot(scanner)
+                continue
+            events = watcher.read()
+            time.sleep(SETTLE)
+            events += watcher.read(0)
+            if any(path is None for path, _, _ in events):
+                scanner.scan()
+                watch_library(watcher, root, scanner.library)
+                with lock:
+                    write_snapshot(scanner)
+                continue
+            touched = set()
+            for path, mask, name in events:
+                if path.rstrip("/") + "/" == root:
+                    touched.add(name)
+                else:
+                    touched.add(os.path.relpath(path, root).split(os.sep)[0])
+                if mask & fswatch.IN_ISDIR and mask & (fswatch.IN_CREATE | fswatch.IN_MOVED_TO):
+                    # New show or season: watch it (and, for a show, the seasons it arrived with).
+                    watch_show(watcher, os.path.join(path, name))
+            with lock:
+                changed = [show for show in touched if show and scanner.update(show)]
+                if changed:
+                    scanner.save()
+                    write_snapshot(scanner)
+    finally:
+        server.shutdown()
+        server.server_close()
+        os.remove(SOCKET_PATH)
+        if watcher:
+            watcher.close()
+
+
+def print_report(library_dict: dict):
     for anime, info in library_dict.items():
         print(f"{colored(255,165,0,anime.rstrip())}:")
         for key, value in info.items():
@@ -58,3 +326,30 @@ if __name__ == "__main__":
                 f"  {colored(238,130,238,key.rstrip())}: {colored(220, 20, 60,value)}"
             )
         print()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if "--daemon" in sys.argv:
+        try:
+            run_daemon(args[0] if args else root_directory)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if "--query" in sys.argv:
+        try:
+            reply = query(args[0] if args else "")
+        except (FileNotFoundError, ConnectionRefusedError):
+            print("The library daemon isn't running (libraryparse.py --daemon)")
+            sys.exit(1)
+        print(json.dumps(reply, indent=2, ensure_ascii=False))
+        sys.exit(0)
+    scanner = LibraryScanner(
+        args[0] if args else root_directory,
+        cache_path=None if "--no-cache" in sys.argv else CACHE_PATH,
+    )
+    library_dict = scanner.scan()
+    if "--json" in sys.argv:
+        print(json.dumps(library_dict, indent=2, ensure_ascii=False))
+    else:
+        print_report(library_dict)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Health of the manga library as download_chapters lays it out: {title}/{volume}/{chapter} {name}/ or .cbz.
+
+    manga_health.py [ROOT] [--json] [--no-cache]
+
+Per title: chapter count, missing chapter numbers, numbers stored more than once,
+empty or broken chapters, interrupted downloads left behind, and size on disk.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from cbz import IMAGE_EXTS
+from chapter_catalog import chapter_key
+
+CACHE_PATH = os.path.expanduser(os.getenv("MANGA_HEALTH_CACHE", "~/.cache/manga_health.json"))
+WORKERS = int(os.getenv("MANGA_HEALTH_WORKERS", 16))
+
+
+def chapter_label(name: str) -> str:
+    """The chapter number download_chapters put at the front of the entry name."""
+    if name.endswith(".cbz"):
+        name = name[: -len(".cbz")]
+    return name.split(" ", 1)[0]
+
+
+def number_ranges(numbers) -> list:
+    """[12, 13, 14, 20] -> ["12-14", "20"]."""
+    ranges = []
+    for n in sorted(numbers):
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return [f"{a}-{b}" if a != b else f"{a}" for a, b in ranges]
+
+
+def inspect_dir(path: str):
+    """(pages, bytes, zero-byte pages) of a chapter directory."""
+    pages = size = zero = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith(".") or not entry.name.lower().endswith(IMAGE_EXTS):
+                continue
+            st = entry.stat(follow_symlinks=False)
+            pages += 1
+            size += st.st_size
+            zero += st.st_size == 0
+    return pages, size, zero
+
+
+def inspect_cbz(path: str, size: int):
+    """(pages, bytes, broken) of a chapter archive; only the zip's central directory is read."""
+    if size == 0:
+        return 0, 0, True
+    try:
+        with zipfile.ZipFile(path) as zf:
+            pages = sum(1 for n in zf.namelist() if n.lower().endswith(IMAGE_EXTS))
+    except (zipfile.BadZipFile, OSError):
+        return 0, size, True
+    return pages, size, False
+
+
+def title_signature(path: str) -> list:
+    """mtimes of the title and its volumes: a chapter arriving or leaving changes one of them."""
+    sig = [["", os.stat(path).st_mtime_ns]]
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                sig.append([entry.name, entry.stat(follow_symlinks=False).st_mtime_ns])
+    return sorted(sig)
+
+
+def inspect_title(path: str) -> dict:
+    """One pass over a title's volumes and chapters."""
+    report = {
+        "chapters": 0,
+        "bytes": 0,
+        "gaps": [],
+        "duplicates": [],
+        "unnumbered": 0,
+        "empty": [],
+        "broken": [],
+        "partial": [],
+    }
+    seen = {}
+    with os.scandir(path) as volumes:
+        for volume in volumes:
+            if not volume.is_dir(follow_symlinks=False):
+                continue
+            with os.scandir(volume.path) as chapters:
+                for chapter in chapters:
+                    where = f"{volume.name}/{chapter.name}"
+                    if chapter.name.startswith(".") or chapter.name.endswith(".tmp"):
+                        # Staging directory or half-written archive from an interrupted download.
+                        if chapter.name.endswith((".part", ".tmp")):
+                            report["partial"].append(where)
+                        continue
+                    if chapter.is_dir(follow_symlinks=False):
+                        pages, size, zero = inspect_dir(chapter.path)
+                        broken = zero > 0
+                    elif chapter.name.endswith(".cbz"):
+                        st = chapter.stat(follow_symlinks=False)
+                        pages, size, broken = inspect_cbz(chapter.path, st.st_size)
+                    else:
+                        continue
+                    report["chapters"] += 1
+                    report["bytes"] += size
+                    if broken:
+                        report["broken"].append(where)
+                    elif pages == 0:
+                        report["empty"].append(where)
+                    label = chapter_label(chapter.name)
+                    key = chapter_key(label)
+                    if key[0] == float("inf"):
+                        report["unnumbered"] += 1
+                        continue
+                    seen.setdefault(key, []).append(where)
+    numbers = {int(number) for number, _ in seen}
+    if numbers:
+        missing = set(range(min(numbers), max(numbers) + 1)) - numbers
+        report["gaps"] = number_ranges(missing)
+    report["duplicates"] = sorted(places for places in seen.values() if len(places) > 1)
+    return report
+
+
+class HealthScanner:
+    """Parallel report over every title, reusing the cached report of titles whose signature hasn't moved."""
+
+    def __init__(self, root: str, cache_path: str = CACHE_PATH, workers: int = WORKERS):
+        self.root = root
+        self.cache_path = cache_path
+        self.workers = workers
+        self.cache = {}
+        if cache_path:
+            try:
+                with open(cache_path) as f:
+                    self.cache = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        self.lock = threading.Lock()
+        self.inspected = 0
+        self.reused = 0
+
+    def scan_title(self, path: str):
+        try:
+            sig = title_signature(path)
+            cached = self.cache.get(path)
+            if cached and cached["sig"] == sig:
+                with self.lock:
+                    self.reused += 1
+                return path, cached
+            entry = {"sig": sig, "report": inspect_title(path)}
+        except FileNotFoundError:
+            return path, None
+        with self.lock:
+            self.inspected += 1
+        return path, entry
+
+    def scan(self) -> dict:
+        """{title: report}, sorted by title."""
+        titles = sorted(
+            e.path
+            for e in os.scandir(self.root)
+            if e.is_dir(follow_symlinks=False) and not e.name.startswith(".")
+        )
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            self.cache = {path: entry for path, entry in pool.map(self.scan_title, titles) if entry}
+        self.save()
+        return {os.path.basename(path): entry["report"] for path, entry in self.cache.items()}
+
+    def save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.cache, f)
+        os.replace(tmp, self.cache_path)
+
+
+def print_table(reports: dict, colored):
+    width = min(max((len(t) for t in reports), default=5), 48)
+    print(f"{'Title':<{width}} {'Chapters':>8} {'Size':>9}  Problems")
+    for title, r in reports.items():
+        problems = []
+        if r["gaps"]:
+            problems.append(colored(255, 165, 0, f"missing {', '.join(r['gaps'])}"))
+        if r["duplicates"]:
+            problems.append(colored(238, 130, 238, f"{len(r['duplicates'])} duplicated"))
+        for key in ("empty", "broken", "partial"):
+            if r[key]:
+                problems.append(colored(255, 0, 0, f"{len(r[key])} {key}"))
+        name = title if len(title) <= width else title[: width - 1] + "…"
+        print(
+            f"{name:<{width}} {r['chapters']:>8} {r['bytes'] / 1048576:>7.1f}MB  "
+            f"{'; '.join(problems) or colored(0, 255, 0, 'ok')}"
+        )
+
+
+if __name__ == "__main__":
+    from helper import MANGA_ROOT, colored
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    start = time.monotonic()
+    scanner = HealthScanner(
+        args[0] if args else MANGA_ROOT,
+        cache_path=None if "--no-cache" in sys.argv else CACHE_PATH,
+    )
+    reports = scanner.scan()
+    if "--json" in sys.argv:
+        print(json.dumps(reports, indent=2, ensure_ascii=False))
+        sys.exit(0)
+    print_table(reports, colored)
+    chapters = sum(r["chapters"] for r in reports.values())
+    size = sum(r["bytes"] for r in reports.values())
+    print(
+        f"\n{colored(0,0,255,'Titles:')} {len(reports)}  {colored(0,0,255,'Chapters:')} {chapters}  "
+        f"{colored(0,0,255,'Size:')} {size / 1073741824:.2f} GB  "
+        f"({scanner.inspected} scanned, {scanner.reused} cached, {time.monotonic() - start:.2f}s)"
+    )
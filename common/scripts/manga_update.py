@@ -5,35 +5,138 @@
 import MangaDexPy
 from MangaDexPy import downloader
 from helper import *
-import sys, datetime, re, contextlib
+import sys, datetime, re, contextlib, json, os, time
+import http_client
+import metrics
+import transcode
+from chapter_catalog import ChapterCatalog, chapter_key
+from poll_scheduler import PollScheduler, RequestBudget
+from check_history import HistoryStore
+from metadata_cache import get_cache
 
 
-cli = MangaDexPy.MangaDex()
+cli = new_client()
+history = HistoryStore()
+CURSOR_PATH = os.path.expanduser("~/.cache/manga_update_cursor.json")
 
 
-def get_latest_chapter(manga_id: str):
-    manga = cli.get_manga(manga_id)
+def load_cursor():
     try:
-        chapters = manga.get_chapters()
-        eng_chapters = [x for x in chapters if x.language == "en" if x.chapter]
-        external_uploaders = [
-            "MangaDex",
-            "comikey",
-            "NotXunder",
-            "AzukiTeam",
-            "inkrcomics",
-        ]
-        sorted_chapters = sorted(eng_chapters, key=lambda chap: float(chap.chapter))
-        third_party = [
-            x for x in sorted_chapters if x.uploader.username in external_uploaders
-        ]
-        latest_chapter = sorted_chapters[-1]
+        with open(CURSOR_PATH) as f:
+            return json.load(f).get("since")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_cursor(since: str):
+    tmp = f"{CURSOR_PATH}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"since": since}, f)
+    os.replace(tmp, CURSOR_PATH)
+
+
+def feed_manga_id(chapter: dict):
+    return next((rel["id"] for rel in chapter["relationships"] if rel["type"] == "manga"), None)
+
+
+def fetch_feed_since(manga_ids: list, since: str):
+    """English chapters created after `since` from the list's own feed, limited to titles in `manga_ids`."""
+    wanted = set(manga_ids)
+    headers = {"Authorization": f"Bearer {get_session_token()}"}
+    chapters = []
+    offset = 0
+    while True:
+        params = {
+            "translatedLanguage[]": ["en"],
+            "createdAtSince": since,
+            "order[createdAt]": "asc",
+            "contentRating[]": ["safe", "suggestive", "erotica", "pornographic"],
+            # Uploader and group, so external uploads are recognised without another request.
+            "includes[]": ["scanlation_group", "user"],
+            "limit": 100,
+            "offset": offset,
+        }
+        r = http_client.get(f"{API_URL}/list/{MDLIST_ID}/feed", params=params, headers=headers)
+        r.raise_for_status()
+        page = r.json()
+        chapters.extend(c for c in page["data"] if feed_manga_id(c) in wanted)
+        offset += len(page["data"])
+        if not page["data"] or offset >= page["total"]:
+            break
+    return chapters
+
+
+def poll_incremental(mdlist: list):
+    since = load_cursor()
+    started = datetime.datetime.now(datetime.timezone.utc)
+    if since is None:
+        # No high-water mark yet: do one full pass and start tracking from here.
+        for manga in mdlist:
+            get_latest_chapter(manga)
+        save_cursor(started.strftime("%Y-%m-%dT%H:%M:%S"))
+        return
+    with metrics.span("feed_poll"):
+        feed = fetch_feed_since(mdlist, since)
+    updated = {}
+    newest = since
+    for chapter in feed:
+        created = chapter["attributes"]["createdAt"][:19]
+        newest = max(newest, created)
+        updated.setdefault(feed_manga_id(chapter), []).append(MangaDexPy.Chapter(chapter, cli))
+    print(
+        f"{colored(0,0,255,len(feed))} new chapters across {colored(0,255,0,len(updated))} titles since {since}"
+    )
+    for manga, chapters in updated.items():
+        # Alert from the feed entries themselves when they carry a higher number than we've seen.
+        get_latest_chapter(manga, seen=since, chapters=chapters)
+    if feed:
+        # createdAtSince is inclusive, so step past the newest chapter we've already handled.
+        newest = datetime.datetime.fromisoformat(newest) + datetime.timedelta(seconds=1)
+        save_cursor(newest.strftime("%Y-%m-%dT%H:%M:%S"))
+
+
+def get_latest_chapter(manga_id: str, recent: bool = None, seen: str = None, chapters: list = None):
+    """Check one title and alert on a new chapter.
+
+    Whether the latest chapter counts as new is, in order: `recent` if given, newer
+    than the `seen` createdAt if given, else inside the fixed lookback window.
+    `chapters`, if given, are used instead of pulling the title's whole feed, but
+    only when their highest number is above the last one recorded for the title;
+    re-uploads and extra groups' copies of known chapters fall back to the whole
+    feed and never alert.
+    Returns the latest createdAt and the createdAt of every chapter, or None.
+    """
+    with metrics.title(manga_id) as record:
+        return _get_latest_chapter(manga_id, recent, seen, record, chapters)
+
+
+def _get_latest_chapter(manga_id: str, recent: bool, seen: str, record: dict, chapters: list = None):
+    with metrics.span("get_manga"):
+        manga = get_cache().get_manga(cli, manga_id, fields=("title",))
+    record["title"] = get_manga_title(manga)
+    try:
+        if chapters is not None:
+            newest = ChapterCatalog(chapters, exclude_uploaders=(), dedupe=False).latest()
+            known = history.latest_chapter(manga_id)
+            if newest is None or known is None or chapter_key(newest.chapter) <= chapter_key(known):
+                chapters = None
+                if known is not None:
+                    recent = False
+        if chapters is None:
+            with metrics.span("get_chapters"):
+                chapters = manga.get_chapters()
+        with metrics.span("sort"):
+            catalog = ChapterCatalog(chapters, exclude_uploaders=(), dedupe=False)
+        latest_chapter = catalog.latest()
+        if latest_chapter is None:
+            raise IndexError("no English chapters")
     except KeyboardInterrupt:
         sys.exit(1)
     except:
         print(
             f"{colored(255,0,0,get_manga_title(manga))} failed to get chapter list..."
         )
+        record["status"] = "chapter list failed"
         return None
 
     latest_list = [latest_chapter]
@@ -43,35 +146,113 @@ def get_latest_chapter(manga_id: str):
         since_when = 120
     else:
         since_when = 33
-    if check_recent(latest_chapter.created_at, offset=since_when):
+    if recent is None and seen is not None:
+        recent = latest_chapter.created_at > seen
+    if recent is None:
+        recent = check_recent(latest_chapter.created_at, offset=since_when)
+    if recent:
+        # The alert shows the cover and the download credits the author; make sure those are fresh too.
+        with metrics.span("get_manga"):
+            manga = get_cache().get_manga(cli, manga_id)
         d = DiscordWebHook(bot_name="New Chapter Alert!!")
-        if latest_chapter in third_party:
-            d.send_message(
-                f"***New Chapter Alert***\n*Manga*: **{manga_title}**\n*Chapter*: **{latest_chapter.chapter}**\n*External Uploader:* {pull_externalURL(latest_chapter.id)}\n*Created at:* **{fix_time(latest_chapter.created_at)}**",
-                image_url=f"{manga.cover.url}",
-                Ping=False,
-            )
+        if catalog.is_external(latest_chapter):
+            with metrics.span("notify"):
+                d.send_message(
+                    f"***New Chapter Alert***\n*Manga*: **{manga_title}**\n*Chapter*: **{latest_chapter.chapter}**\n*External Uploader:* {pull_externalURL(latest_chapter.id)}\n*Created at:* **{fix_time(latest_chapter.created_at)}**",
+                    image_url=f"{manga.cover.url}",
+                    Ping=False,
+                )
         else:
-            d.send_message(
-                f"***New Chapter Alert***\nManga: **{manga_title}**\nChapter: **{latest_chapter.chapter}**\n*Created at:* **{fix_time(latest_chapter.created_at)}**",
-                image_url=f"{manga.cover.url}",
-                Ping=True,
-            )
+            with metrics.span("notify"):
+                d.send_message(
+                    f"***New Chapter Alert***\nManga: **{manga_title}**\nChapter: **{latest_chapter.chapter}**\n*Created at:* **{fix_time(latest_chapter.created_at)}**",
+                    image_url=f"{manga.cover.url}",
+                    Ping=True,
+                )
             # Currently broken.
             _= download_chapters(latest_list, manga)
-            d.send_message(f"This chapter has been downloaded. (maybe check it out)")
+            with metrics.span("notify"):
+                d.send_message(f"This chapter has been downloaded. (maybe check it out)")
             # d.send_message("Downloading is currently broken. Thanks mangadex fuckers")
-    with open("/home/USER_NAME/.cache/manga_check.log", "a") as myfile:
-        myfile.write(
-            f"{(datetime.datetime.now(datetime.timezone.utc)- datetime.timedelta(hours=4)).strftime('%m-%d-%y %H:%M:%S')}: {manga_title}: {latest_chapter.chapter}, {fix_time(latest_chapter.created_at)}\n"
-        )
+    created = (
+        datetime.datetime.fromisoformat(latest_chapter.created_at)
+        .astimezone(datetime.timezone.utc)
+        .isoformat(timespec="seconds")
+    )
+    history.record(manga_id, manga_title, latest_chapter.chapter, created)
     print(
         f"{colored(0,255,0,manga_title)}: {colored(255,0,0,latest_chapter.chapter)}, {colored(0,0,255, fix_time(latest_chapter.published_at))}"
     )
+    return {
+        "latest": latest_chapter.created_at,
+        "history": [chapter.created_at for chapter in catalog],
+    }
+
+
+def run_daemon():
+    """Poll titles forever, each on its own cadence from PollScheduler, within a global request budget."""
+    # Expected API requests per poll; each poll is then charged what it actually sent
+    # (every feed page, at-home and external-URL lookups, retries), and the estimate follows.
+    cost = 2.0
+    budget = RequestBudget(float(os.getenv("POLL_BUDGET", 600)))
+    scheduler = PollScheduler()
+    list_refresh = int(os.getenv("POLL_LIST_REFRESH", 30 * 60))
+    flush_every = 60 * 60
+    refreshed = 0.0
+    flushed = time.time()
+    metrics.start_run("manga_update_daemon")
+    while True:
+        now = time.time()
+        if now - refreshed > list_refresh:
+            try:
+                scheduler.sync(get_mdlist(), now)
+                refreshed = now
+            except Exception as e:
+                print(colored(255, 0, 0, f"List refresh failed: {e}"))
+        if now - flushed > flush_every:
+            metrics.finish_run()
+            metrics.start_run("manga_update_daemon")
+            flushed = now
+        item = scheduler.peek()
+        if item is None:
+            time.sleep(60)
+            continue
+        due, manga_id = item
+        wait = max(due - now, budget.wait_time(cost))
+        if wait > 0:
+            # Wake up at least every minute so list refreshes and metric flushes still happen.
+            time.sleep(min(wait, 60))
+            continue
+        scheduler.pop()
+        seen = scheduler.state[manga_id]["seen"]
+        sent = http_client.api_requests()
+        try:
+            result = get_latest_chapter(manga_id, seen=seen)
+        except Exception as e:
+            print(colored(255, 0, 0, f"{manga_id} failed: {e}"))
+            result = None
+        sent = http_client.api_requests() - sent
+        budget.spend(sent)
+        cost = 0.8 * cost + 0.2 * sent
+        if result:
+            next_at = scheduler.reschedule(manga_id, result["history"], result["latest"], time.time())
+        else:
+            next_at = scheduler.reschedule(manga_id, None, None, time.time())
+        print(f"  next check in {colored(0,0,255, f'{(next_at - time.time()) / 3600:.1f}h')}")
+        scheduler.save()
+        with metrics.span("history_write"):
+            history.flush()
 
 
 def main():
+    if "--daemon" in sys.argv:
+        run_daemon()
+        return
+    metrics.start_run("manga_update")
     mdlist = get_mdlist()
+    if "--incremental" in sys.argv:
+        poll_incremental(mdlist)
+        return
     for manga in mdlist:
         get_latest_chapter(manga)
 
@@ -81,3 +262,8 @@ if __name__ == "__main__":
         main()
     except KeyboardInterrupt:
         pass
+    finally:
+        with metrics.span("history_write"):
+            history.flush()
+        transcode.shutdown()
+        metrics.finish_run()
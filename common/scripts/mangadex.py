@@ -1,158 +1,170 @@
 #!/usr/bin/env python3
 import MangaDexPy
+import json
 import os
 import sys
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from helper import (
     colored,
-    DiscordWebHook,
-    get_manga_title,
     download_chapters,
     get_mdlist,
     clean_up_parents,
+    MANGA_ROOT,
+    new_client,
 )
+from chapter_index import get_index
+from chapter_catalog import ChapterCatalog
+import http_client
+import metrics
+import transcode
+from cover_cache import get_cover
+from metadata_cache import get_cache
+from notify_queue import get_queue
 
 
 def sort_chapters(chapters: list):
-    external_uploaders = [
-        "MangaDex",
-        "comikey",
-        "NotXunder",
-        "AzukiTeam",
-        "inkrcomics",
-    ]
-    eng_chapters = [
-        x
-        for x in chapters
-        if x.language == "en"
-        if x.uploader.username not in external_uploaders
-        if x.chapter
-    ]
-    sorted_chapters = sorted(eng_chapters, key=lambda chap: float(chap.chapter))
-    unique_chapters_dict = {}
-    for chapter in sorted_chapters:
-        chapter_number = chapter.chapter
-        if chapter_number not in unique_chapters_dict:
-            unique_chapters_dict[chapter_number] = chapter
-    # Extracting the unique chapter objects
-    sorted_chapters = list(unique_chapters_dict.values())
-    return sorted_chapters
+    return list(ChapterCatalog(chapters))
 
 
 def notify_send(title, new_chapters, cover_url=None):
+    with metrics.span("notify"):
+        _notify_send(title, new_chapters, cover_url)
+
+
+def _notify_send(title, new_chapters, cover_url=None):
+    icon = get_cover(cover_url) or os.path.expanduser("~/.cache/mdex.jpg")
     os.system(
-        f"""notify-send -a MangaUpdater -i ~/.cache/mdex.jpg -u normal \"Downloaded {new_chapters} new chapters of {title} from MangaDex\" """
+        f"""notify-send -a MangaUpdater -i \"{icon}\" -u normal \"Downloaded {new_chapters} new chapters of {title} from MangaDex\" """
     )
-    d = DiscordWebHook(f"{title}")
-    if cover_url and new_chapters > 0:
-        d.send_message(
-            f"Downloaded ***{new_chapters}*** new chapters of ***{title}*** from MangaDex",
-            image_url=cover_url,
-            Ping=True,
-        )
-    elif new_chapters > 0:
-        d.send_message(
-            f"Downloaded ***{new_chapters}*** new chapters of ***{title}*** from MangaDex",
-            Ping=True,
-        )
+    if new_chapters > 0:
+        get_queue().update(title, new_chapters, cover_url)
     else:
-        d.send_message(f"No new chapters of ***{title}*** from MangaDex")
+        get_queue().message(f"{title}", f"No new chapters of ***{title}*** from MangaDex")
 
 
 class USER_NAME_MangaDex:
-    def __init__(self, manga_id: str = "", title="", start: float = 0, end: float = -1):
-        self.cli = MangaDexPy.MangaDex()
+    def __init__(
+        self,
+        manga_id: str = "",
+        title="",
+        start: float = None,
+        end: float = None,
+        pick: int = None,
+        as_json: bool = False,
+    ):
+        self.cli = new_client()
         self.manga_id = manga_id
         self.title = title
+        self.start = start
+        self.end = end
+        self.pick = pick
+        self.as_json = as_json
+
+    def download_manga_en(self, show_bar=True):
+        """Download every missing English chapter; returns a summary dict for the update engine."""
+        with metrics.title(self.manga_id) as record:
+            summary = self._download_manga_en(show_bar)
+            record["title"] = summary["title"]
+            record["status"] = summary["status"]
+            metrics.count("chapters_downloaded", summary["new"])
+            return summary
 
-    def download_manga_en(self):
+    def _download_manga_en(self, show_bar=True):
         start = datetime.now()
+        summary = {"id": self.manga_id, "title": self.manga_id, "new": 0, "status": "ok"}
         # Asking the API about that manga with uuid 'manga_id'
         try:
-            manga = self.cli.get_manga(self.manga_id)
+            with metrics.span("get_manga"):
+                manga = get_cache().get_manga(self.cli, self.manga_id)
         except MangaDexPy.NoContentError:
             # API returned a 404 Not Found, therefore the wrapper will return a NoContentError
             print("This manga doesn't exist.")
-            exit(1)
+            summary["status"] = "not found"
+            return summary
         except MangaDexPy.APIError as e:
             # API returned something that wasn't expected, the wrapper will return an APIError
             print("Status code is: " + str(e.status))
-            exit(1)
+            summary["status"] = f"api error {e.status}"
+            return summary
         try:
             manga_title = manga.title["en"]
         except KeyError:
             manga_title = manga.title["ja-ro"]
+        summary["title"] = manga_title
         print(
             f"Manga is: {colored(87,8,97,manga_title)} written by {colored(255,0,0,manga.author[0].name)}"
         )
         cover = f"{manga.cover.url}"
-        os.system(f"wget --quiet -O ~/.cache/mdex.jpg {cover}")
+        with metrics.span("cover"):
+            get_cover(cover)
         # # Getting chapters for that manga
         try:
-            chapters = manga.get_chapters()
+            with metrics.span("get_chapters"):
+                chapters = manga.get_chapters()
         except Exception as e:
             print(colored(255, 0, 0, f"Something went wrong with {manga_title}: {e}"))
-            return 1
-        sorted_chapters = sort_chapters(chapters)
-        new_chapters, name_manga = download_chapters(sorted_chapters, manga)
+            summary["status"] = f"chapter list failed: {e}"
+            return summary
+        with metrics.span("sort"):
+            sorted_chapters = sort_chapters(chapters)
+        new_chapters, name_manga = download_chapters(
+            sorted_chapters, manga, show_bar=show_bar
+        )
+        summary["new"] = new_chapters
         end = datetime.now()
         taken = str(end - start)
+        summary["elapsed"] = (end - start).total_seconds()
         message = "Time taken: "
         print(f"{colored(0,0,255, message)}{colored(0,255,0,taken[:10])}")
         if new_chapters >= 1:
             notify_send(name_manga, new_chapters, cover)
+        return summary
 
     def search(self):
-        results = self.cli.search("manga", {"title": self.title}, limit=20)
-        count = 1
-        for result in results:
-            # author = self.cli.search("author", {"id": result.author[0]})
-            result_title = get_manga_title(result)
-            if result_title is None:
-                raise Exception(f"Language not matched. {result.title}")
-            try:
-                print(
-                    f"{colored(0,0,255, f'{count}.')} {colored(255,255,0,result_title)}- {result.desc['en'][:40]}...\n"
-                    f"URL to Manga: {colored(0,255,0,f'https://mangadex.org/title/{result.id}')}"
-                )
-            except TypeError:
-                print(
-                    colored(
-                        255,
-                        0,
-                        0,
-                        "This result threw a TypeError. Showing again without desc.",
-                    )
-                )
-                print(
-                    f"{colored(0,0,255,f'{count}.')}{colored(255,255,0, result_title)}...\n"
-                    f"URL to Manga: {colored(0,255,0,f'https://mangadex.org/title/{result.id}')}"
-                )
-            except KeyError:
-                print(
-                    f"{colored(0,0,255, f'{count}.')} {colored(255,0,0, 'No known Title it seems')}"
-                )
+        """Show the search results for self.title and return the chosen manga id.
+
+        With self.pick set the choice is made without prompting; with self.as_json
+        the results are printed as JSON and None is returned unless a pick was given.
+        """
+        with metrics.span("search"):
+            results = get_cache().search(self.cli, self.title)
+        if not results:
+            print(colored(255, 0, 0, f"Nothing found for {self.title}"))
+            exit(1)
+        if self.as_json:
+            print(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            for count, result in enumerate(results, 1):
+                title = result["title"] or "No known Title it seems"
+                authors = ", ".join(result["authors"]) or "unknown"
+                desc = " ".join(result["description"].split())[:40]
+                url = f"https://mangadex.org/title/{result['id']}"
                 print(
-                    f"{colored(255,255,0,result.title)}\n"
-                    f"Download this manga using the UUID: {colored(0,255,0,result.id)}"
+                    f"{colored(0,0,255, f'{count}.')} {colored(255,255,0,title)} by {colored(255,0,0,authors)}- {desc}...\n"
+                    f"URL to Manga: {colored(0,255,0,url)}"
                 )
-            count += 1
-        download_this = int(
-            input("Enter the number of the result you'd like to download: ")
-        )
-        return results[download_this - 1].id
-        # print(f"Now Downloading:")
-        # search_dl(manga_id=results[download_this - 1].id)
+        if self.pick is None:
+            if self.as_json:
+                return None
+            self.pick = int(input("Enter the number of the result you'd like to download: "))
+        if not 1 <= self.pick <= len(results):
+            print(f"Pick must be between 1 and {len(results)}.")
+            exit(1)
+        return results[self.pick - 1]["id"]
 
     def chapter_dl(self):
         self.manga_id = self.search()
-        start_chapter = float(input("Choose starting chapter: "))
-        end_chapter = float(input("Choose ending chapter: "))
+        if self.manga_id is None:
+            return
+        start_chapter = self.start if self.start is not None else float(input("Choose starting chapter: "))
+        end_chapter = self.end if self.end is not None else float(input("Choose ending chapter: "))
         start_time = datetime.now()
         # Asking the API about that manga with uuid 'manga_id'
         try:
-            manga = self.cli.get_manga(self.manga_id)
+            with metrics.span("get_manga"):
+                manga = get_cache().get_manga(self.cli, self.manga_id, fields=("title", "author"))
         except MangaDexPy.NoContentError:
             # API returned a 404 Not Found, therefore the wrapper will return a NoContentError
             print("This manga doesn't exist.")
@@ -169,13 +181,10 @@ class USER_NAME_MangaDex:
             f"Manga is: {colored(87,8,97,manga_title)} written by {colored(255,0,0,manga.author[0].name)}"
         )
         # # Getting chapters for that manga
-        chapters = manga.get_chapters()
-        sorted_chapters = sort_chapters(chapters)
-        new_chapters = [
-            x
-            for x in sorted_chapters
-            if float(x.chapter) <= end_chapter and float(x.chapter) >= start_chapter
-        ]
+        with metrics.span("get_chapters"):
+            chapters = manga.get_chapters()
+        with metrics.span("sort"):
+            new_chapters = ChapterCatalog(chapters).range(start_chapter, end_chapter)
         download_chapters(new_chapters, manga)
         end_time = datetime.now()
         taken = str(end_time - start_time)
@@ -184,7 +193,57 @@ class USER_NAME_MangaDex:
 
     def search_dl(self):
         self.manga_id = self.search()
-        self.download_manga_en()
+        if self.manga_id is not None:
+            self.download_manga_en()
+
+
+def update_one(manga_id: str, show_bar: bool):
+    start = datetime.now()
+    try:
+        summary = USER_NAME_MangaDex(manga_id=manga_id).download_manga_en(show_bar)
+    except Exception as e:
+        # One broken title shouldn't take the rest of the queue down with it.
+        summary = {"id": manga_id, "title": manga_id, "new": 0, "status": f"crashed: {e}"}
+    summary.setdefault("elapsed", (datetime.now() - start).total_seconds())
+    return summary
+
+
+def run_updates(md_list: list, workers: int = 4):
+    """Update every title on the list, `workers` at a time, and print a per-title summary."""
+    start = datetime.now()
+    results = []
+    show_bar = workers <= 1
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(update_one, manga_id, show_bar) for manga_id in md_list]
+        for future in as_completed(futures):
+            summary = future.result()
+            results.append(summary)
+            if not show_bar:
+                print(
+                    f"[{len(results)}/{len(md_list)}] {colored(255,255,0,summary['title'])}: "
+                    f"{summary['new']} new, {summary['status']} ({summary['elapsed']:.1f}s)"
+                )
+    print(colored(255, 165, 0, "\nUpdate summary:"))
+    for summary in sorted(results, key=lambda r: r["elapsed"], reverse=True):
+        status = summary["status"]
+        status = colored(0, 255, 0, status) if status == "ok" else colored(255, 0, 0, status)
+        print(
+            f"  {colored(87,8,97,summary['title'])}: {summary['new']} new, {status}, {summary['elapsed']:.1f}s"
+        )
+    failed = sum(1 for r in results if r["status"] != "ok")
+    total_new = sum(r["new"] for r in results)
+    taken = str(datetime.now() - start)
+    print(
+        f"{colored(0,0,255,'Titles:')} {len(results)}  {colored(0,0,255,'New chapters:')} {total_new}  "
+        f"{colored(0,0,255,'Failed:')} {failed}  {colored(0,0,255,'Time taken:')} {colored(0,255,0,taken[:10])}"
+    )
+    cache = get_cache()
+    print(f"  {colored(0,0,255,'metadata cache')}: {cache.hits} hits, {cache.misses} misses")
+    for host, counts in http_client.stats().items():
+        print(
+            f"  {colored(0,0,255,host)}: {counts['requests']} requests, {counts['retries']} retries, {counts['failures']} failures"
+        )
+    return results
 
 
 def is_valid_uuid(value):
@@ -195,34 +254,84 @@ def is_valid_uuid(value):
         return False
 
 
+def option(name: str, kind=str):
+    """Value following `name` on the command line, e.g. option("--pick", int); None when absent."""
+    if name not in sys.argv:
+        return None
+    try:
+        return kind(sys.argv[sys.argv.index(name) + 1])
+    except (IndexError, ValueError):
+        print(f"{name} needs a {kind.__name__} value.")
+        exit(1)
+
+
+def positional(args: list) -> list:
+    """`args` without the --flags and the values of the flags that take one."""
+    valued = ("--pick", "--start", "--end")
+    return [a for i, a in enumerate(args) if not a.startswith("--") and (i == 0 or args[i - 1] not in valued)]
+
+
 def main():
     if len(sys.argv) <= 1:
         print("You need to pass the script an argument")
     else:
         argument = sys.argv[1]
+        metrics.start_run("updates" if argument == "updates" else "mangadex")
         if is_valid_uuid(argument):
             mdex = USER_NAME_MangaDex(manga_id=argument)
-            mdex.download_manga_en()
+            if mdex.download_manga_en()["status"] != "ok":
+                exit(1)
         elif argument == "chapter":
+            # mangadex.py chapter TITLE [--pick N] [--start X] [--end Y] [--json]
             try:
-                titl = sys.argv[2]
-            except:
+                titl = positional(sys.argv[2:])[0]
+            except IndexError:
                 print("Enter a title, please.")
                 exit(1)
-            mdex = USER_NAME_MangaDex(title=titl)
+            mdex = USER_NAME_MangaDex(
+                title=titl,
+                start=option("--start", float),
+                end=option("--end", float),
+                pick=option("--pick", int),
+                as_json="--json" in sys.argv,
+            )
             mdex.chapter_dl()
+        elif argument == "invalidate":
+            # mangadex.py invalidate [manga_id] [title|author|cover]
+            manga_id = sys.argv[2] if len(sys.argv) > 2 and is_valid_uuid(sys.argv[2]) else None
+            field = sys.argv[-1] if sys.argv[-1] in ("title", "author", "cover") else None
+            get_cache().invalidate(manga_id, field)
+            print(f"Invalidated {field or 'all'} metadata for {manga_id or 'every title'}")
+        elif argument == "reindex":
+            count = get_index().rebuild(MANGA_ROOT)
+            print(f"{colored(0,255,0,count)} chapters indexed from {MANGA_ROOT}")
         elif argument == "updates":
             print("Finding and deleting empty chapters and images....")
-            clean_up_parents("/mnt/NAS/Manga/")
+            clean_up_parents(MANGA_ROOT, touched_only="--full-prune" not in sys.argv)
             md_list = get_mdlist()
-            d = DiscordWebHook("Spam Incoming!")
-            d.send_message("Starting mass updates...", Ping=True)
-            for manga in md_list:
-                mdex = USER_NAME_MangaDex(manga_id=manga)
-                mdex.download_manga_en()
-            d.send_message("Spam complete!", Ping=False)
+            notifications = get_queue()
+            notifications.message("Spam Incoming!", "Starting mass updates...", Ping=True)
+            args = [a for a in sys.argv[2:] if not a.startswith("--")]
+            try:
+                workers = int(args[0])
+            except IndexError:
+                workers = int(os.getenv("MDEX_WORKERS", 4))
+            except ValueError:
+                print("Worker count must be a number.")
+                exit(1)
+            run_updates(md_list, workers)
+            notifications.message("Spam Incoming!", "Spam complete!", Ping=False)
+            notifications.close()
+            print(
+                f"Notifications sent: {colored(0,255,0,notifications.sent)}, dropped: {colored(255,0,0,notifications.dropped)}"
+            )
         else:
-            mdex = USER_NAME_MangaDex(title=argument)
+            # mangadex.py TITLE [--pick N] [--json]
+            mdex = USER_NAME_MangaDex(
+                title=" ".join(positional(sys.argv[1:])),
+                pick=option("--pick", int),
+                as_json="--json" in sys.argv,
+            )
             mdex.search_dl()
 
 
@@ -231,3 +340,6 @@ if __name__ == "__main__":
         main()
     except KeyboardInterrupt:
         sys.exit(1)
+    finally:
+        transcode.shutdown()
+        metrics.finish_run()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import MangaDexPy
+
+import http_client
+from helper import get_manga_title
+
+CACHE_PATH = os.path.expanduser(os.getenv("MDEX_META_CACHE", "~/.cache/mdex_meta.db"))
+# Seconds each field may be served from cache; the cover changes with new volumes, names almost never.
+FIELD_TTL = {
+    "title": int(os.getenv("MDEX_TTL_TITLE", 7 * 24 * 60 * 60)),
+    "author": int(os.getenv("MDEX_TTL_AUTHOR", 30 * 24 * 60 * 60)),
+    "cover": int(os.getenv("MDEX_TTL_COVER", 24 * 60 * 60)),
+}
+INCLUDES = ["author", "artist", "cover_art"]
+SEARCH_TTL = int(os.getenv("MDEX_SEARCH_TTL", 24 * 60 * 60))
+
+
+class MetadataCache:
+    """Raw /manga/{id} entities on disk, so repeated runs rebuild Manga objects without an API call."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS manga (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                title_at REAL NOT NULL,
+                author_at REAL NOT NULL,
+                cover_at REAL NOT NULL
+            )"""
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS search (
+                query TEXT PRIMARY KEY,
+                results TEXT NOT NULL,
+                fetched REAL NOT NULL
+            )"""
+        )
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, manga_id: str, fields):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data, title_at, author_at, cover_at FROM manga WHERE id = ?", (manga_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        fetched = dict(zip(("title", "author", "cover"), row[1:]))
+        now = time.time()
+        if any(now - fetched[field] > FIELD_TTL[field] for field in fields):
+            return None
+        return json.loads(row[0])
+
+    def store(self, manga_id: str, data: dict, fields=("title", "author", "cover")):
+        """Save a fetched entity; only `fields` count as refreshed, the others keep their age."""
+        now = time.time()
+        refreshed = ", ".join(f"{field}_at = excluded.{field}_at" for field in FIELD_TTL if field in fields)
+        with self.lock:
+            self.db.execute(
+                f"""INSERT INTO manga VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET data = excluded.data{', ' if refreshed else ''}{refreshed}""",
+                (manga_id, json.dumps(data), now, now, now),
+            )
+            self.db.commit()
+
+    def invalidate(self, manga_id: str = None, field: str = None):
+        """Forget one title (or all), or just mark one field stale so the next lookup refetches."""
+        with self.lock:
+            if field:
+                where, args = ("WHERE id = ?", (manga_id,)) if manga_id else ("", ())
+                self.db.execute(f"UPDATE manga SET {field}_at = 0 {where}", args)
+            elif manga_id:
+                self.db.execute("DELETE FROM manga WHERE id = ?", (manga_id,))
+            else:
+                self.db.execute("DELETE FROM manga")
+            self.db.commit()
+
+    def get_manga(self, cli, manga_id: str, fields=("title", "author", "cover")):
+        """Drop-in for cli.get_manga(): same Manga object and the same NoContentError/APIError on failure.
+
+        `fields` are the parts the caller reads; the entry is refetched once any of them is past its TTL.
+        """
+        data = self.lookup(manga_id, fields)
+        if data is not None:
+            self.hits += 1
+            return MangaDexPy.Manga(data, cli)
+        self.misses += 1
+        r = http_client.get(f"{cli.api}/manga/{manga_id}", params={"includes[]": INCLUDES})
+        if r.status_code == 404:
+            raise MangaDexPy.NoContentError(r)
+        if r.status_code != 200:
+            raise MangaDexPy.APIError(r)
+        data = r.json()["data"]
+        self.store(manga_id, data, fields)
+        return MangaDexPy.Manga(data, cli)
+
+    def search(self, cli, title: str, limit: int = 20):
+        """Search manga by title; returns [{id, title, description, authors}], cached for SEARCH_TTL.
+
+        Authors come embedded in the same request, and every hit is stored as a
+        manga entity, so downloading a search result skips its get_manga call.
+        """
+        query = f"{limit}:{' '.join(title.lower().split())}"
+        with self.lock:
+            row = self.db.execute(
+                "SELECT results, fetched FROM search WHERE query = ?", (query,)
+            ).fetchone()
+        if row and time.time() - row[1] < SEARCH_TTL:
+            self.hits += 1
+            return json.loads(row[0])
+        self.misses += 1
+        r = http_client.get(
+            f"{cli.api}/manga",
+            params={"title": title, "limit": limit, "includes[]": INCLUDES},
+        )
+        if r.status_code != 200:
+            raise MangaDexPy.APIError(r)
+        entities = r.json()["data"]
+        missing = {
+            rel["id"]
+            for data in entities
+            for rel in data["relationships"]
+            if rel["type"] == "author" and "attributes" not in rel
+        }
+        names = {}
+        if missing:
+            # Older API responses can leave includes out; fetch every missing author in one call.
+            a = http_client.get(f"{cli.api}/author", params={"ids[]": sorted(missing), "limit": 100})
+            if a.status_code == 200:
+                names = {x["id"]: x["attributes"]["name"] for x in a.json()["data"]}
+        results = []
+        for data in entities:
+            attrs = data["attributes"]
+            desc = attrs.get("description") or {}
+            results.append(
+                {
+                    "id": data["id"],
+                    "title": get_manga_title(MangaDexPy.Manga(data, cli)),
+                    "description": desc.get("en") or next(iter(desc.values()), ""),
+                    "authors": [
+                        rel.get("attributes", {}).get("name") or names.get(rel["id"], rel["id"])
+                        for rel in data["relationships"]
+                        if rel["type"] == "author"
+                    ],
+                }
+            )
+            self.store(data["id"], data, ("title", "author"))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO search VALUES (?, ?, ?)",
+                (query, json.dumps(results), time.time()),
+            )
+            self.db.commit()
+        return results
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> MetadataCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache()
+        return _cache
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+METRICS_DIR = os.path.expanduser(os.getenv("MDEX_METRICS_DIR", "~/.cache/mdex_metrics"))
+# Point this at node_exporter's --collector.textfile.directory to have runs scraped.
+TEXTFILE_DIR = os.path.expanduser(os.getenv("MDEX_TEXTFILE_DIR", METRICS_DIR))
+
+_local = threading.local()
+_lock = threading.Lock()
+_run = None
+
+
+def new_record(key: str):
+    return {"key": key, "title": key, "status": "ok", "stages": {}, "counts": {}}
+
+
+def start_run(name: str):
+    """Begin collecting spans for one invocation (e.g. "updates" or "manga_update")."""
+    global _run
+    with _lock:
+        _run = {
+            "name": name,
+            "started": time.time(),
+            "start": time.perf_counter(),
+            "records": {},
+            "global": new_record("_run"),
+        }
+    return _run
+
+
+def current():
+    """The per-title record spans on this thread go to; worker threads get it passed in explicitly."""
+    record = getattr(_local, "record", None)
+    if record is not None:
+        return record
+    return _run["global"] if _run else None
+
+
+@contextlib.contextmanager
+def title(key: str):
+    """Attribute every span on this thread to title `key` until the block exits."""
+    record = new_record(key)
+    if _run:
+        with _lock:
+            _run["records"][key] = record
+    previous = getattr(_local, "record", None)
+    _local.record = record
+    try:
+        yield record
+    finally:
+        _local.record = previous
+
+
+def add(stage: str, seconds: float, record=None):
+    record = record if record is not None else current()
+    if record is None:
+        return
+    with _lock:
+        stage_stats = record["stages"].setdefault(stage, [0.0, 0])
+        stage_stats[0] += seconds
+        stage_stats[1] += 1
+
+
+def count(name: str, value=1, record=None):
+    record = record if record is not None else current()
+    if record is None:
+        return
+    with _lock:
+        record["counts"][name] = record["counts"].get(name, 0) + value
+
+
+@contextlib.contextmanager
+def span(stage: str, record=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(stage, time.perf_counter() - start, record)
+
+
+def _atomic_write(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def finish_run():
+    """Append per-title JSON lines and rewrite the Prometheus textfile summarising this run."""
+    global _run
+    with _lock:
+        run, _run = _run, None
+    if run is None:
+        return None
+    elapsed = time.perf_counter() - run["start"]
+    records = list(run["records"].values()) + [run["global"]]
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    stamp = datetime.fromtimestamp(run["started"], timezone.utc).isoformat()
+    with open(os.path.join(METRICS_DIR, f"{run['name']}.jsonl"), "a") as f:
+        for record in records:
+            line = {
+                "run": stamp,
+                "title": record["title"],
+                "key": record["key"],
+                "status": record["status"],
+                "stages": {s: round(v[0], 6) for s, v in record["stages"].items()},
+                "calls": {s: v[1] for s, v in record["stages"].items()},
+                "counts": record["counts"],
+            }
+            f.write(json.dumps(line) + "\n")
+
+    totals = {}
+    maxima = {}
+    calls = {}
+    counts = {}
+    for record in records:
+        for stage, (seconds, n) in record["stages"].items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+            calls[stage] = calls.get(stage, 0) + n
+            if record is not run["global"]:
+                maxima[stage] = max(maxima.get(stage, 0.0), seconds)
+        for name, value in record["counts"].items():
+            counts[name] = counts.get(name, 0) + value
+    job = run["name"]
+    lines = [
+        "# HELP mdex_stage_seconds_total Time spent in each stage during the last run.",
+        "# TYPE mdex_stage_seconds_total gauge",
+    ]
+    lines += [f'mdex_stage_seconds_total{{job="{job}",stage="{s}"}} {v:.6f}' for s, v in sorted(totals.items())]
+    lines += [
+        "# HELP mdex_stage_calls_total Number of spans per stage during the last run.",
+        "# TYPE mdex_stage_calls_total gauge",
+    ]
+    lines += [f'mdex_stage_calls_total{{job="{job}",stage="{s}"}} {v}' for s, v in sorted(calls.items())]
+    lines += [
+        "# HELP mdex_stage_title_seconds_max Slowest single title for each stage during the last run.",
+        "# TYPE mdex_stage_title_seconds_max gauge",
+    ]
+    lines += [f'mdex_stage_title_seconds_max{{job="{job}",stage="{s}"}} {v:.6f}' for s, v in sorted(maxima.items())]
+    lines += [
+        "# HELP mdex_run_count Counters collected during the last run.",
+        "# TYPE mdex_run_count gauge",
+    ]
+    lines += [f'mdex_run_count{{job="{job}",name="{n}"}} {v}' for n, v in sorted(counts.items())]
+    failed = sum(1 for r in run["records"].values() if r["status"] != "ok")
+    lines += [
+        "# TYPE mdex_run_titles gauge",
+        f'mdex_run_titles{{job="{job}"}} {len(run["records"])}',
+        "# TYPE mdex_run_titles_failed gauge",
+        f'mdex_run_titles_failed{{job="{job}"}} {failed}',
+        "# TYPE mdex_run_duration_seconds gauge",
+        f'mdex_run_duration_seconds{{job="{job}"}} {elapsed:.3f}',
+        "# TYPE mdex_run_last_timestamp_seconds gauge",
+        f'mdex_run_last_timestamp_seconds{{job="{job}"}} {run["started"]:.0f}',
+    ]
+    os.makedirs(TEXTFILE_DIR, exist_ok=True)
+    _atomic_write(os.path.join(TEXTFILE_DIR, f"mdex_{job}.prom"), "\n".join(lines) + "\n")
+    return totals
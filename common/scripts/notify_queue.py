@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import atexit
+import os
+import queue
+import threading
+import time
+
+import requests
+
+from helper import DiscordWebHook
+import metrics
+
+# How long to wait for more messages before sending, and how many updates make a digest.
+LINGER = float(os.getenv("NOTIFY_LINGER", 5))
+DIGEST_MIN = int(os.getenv("NOTIFY_DIGEST_MIN", 3))
+MAX_ATTEMPTS = 5
+
+
+class NotificationQueue:
+    """Sends Discord webhook messages from a background thread, folding bursts of updates into digests."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.blocked_until = 0.0
+        self.sent = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name="notify-queue", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def message(self, bot_name: str, content: str, image_url=None, Ping=False):
+        self.queue.put(
+            {"kind": "message", "bot": bot_name, "content": content, "image": image_url, "ping": Ping}
+        )
+
+    def update(self, title: str, new_chapters: int, cover_url=None):
+        self.queue.put({"kind": "update", "title": title, "new": new_chapters, "image": cover_url})
+
+    def close(self, timeout: float = 120):
+        """Flush everything still queued; safe to call more than once."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+    def run(self):
+        while True:
+            first = self.queue.get()
+            batch = [first]
+            if first is not None:
+                deadline = time.monotonic() + LINGER
+                while batch[-1] is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self.queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            stop = batch[-1] is None
+            for item in self.coalesce([b for b in batch if b is not None]):
+                self.send(item)
+            if stop:
+                return
+
+    def coalesce(self, batch: list):
+        """Keep message order, but turn each run of DIGEST_MIN+ title updates into one digest."""
+        out = []
+        run = []
+        for item in batch + [None]:
+            if item is not None and item["kind"] == "update":
+                run.append(item)
+                continue
+            if len(run) >= DIGEST_MIN:
+                lines = "\n".join(f"- ***{u['title']}***: {u['new']}" for u in run)
+                out.append(
+                    {
+                        "bot": "Manga Digest",
+                        "content": f"***{len(run)}*** titles updated from MangaDex:\n{lines}",
+                        "image": None,
+                        "ping": True,
+                    }
+                )
+            else:
+                out.extend(
+                    {
+                        "bot": u["title"],
+                        "content": f"Downloaded ***{u['new']}*** new chapters of ***{u['title']}*** from MangaDex",
+                        "image": u["image"],
+                        "ping": True,
+                    }
+                    for u in run
+                )
+            run = []
+            if item is not None:
+                out.append(item)
+        return out
+
+    def send(self, item: dict):
+        content = item["content"]
+        if len(content) > 2000:
+            content = content[:1996] + "\n..."
+        for _ in range(MAX_ATTEMPTS):
+            wait = self.blocked_until - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                with metrics.span("webhook"):
+                    response = DiscordWebHook(item["bot"]).send_message(
+                        content, image_url=item["image"], Ping=item["ping"]
+                    )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"Webhook send failed: {e}")
+                self.blocked_until = time.monotonic() + 5
+                continue
+            except Exception as e:
+                # A bad webhook URL or the like won't fix itself; don't stall the queue retrying it.
+                print(f"Webhook send failed, dropping message: {e}")
+                break
+            headers = response.headers
+            if headers.get("X-RateLimit-Remaining") == "0":
+                self.blocked_until = time.monotonic() + float(
+                    headers.get("X-RateLimit-Reset-After", 1)
+                )
+            if response.status_code == 429:
+                self.blocked_until = time.monotonic() + float(headers.get("Retry-After", 1))
+                continue
+            if 200 <= response.status_code < 300:
+                self.sent += 1
+                return
+            break
+        self.dropped += 1
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> NotificationQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = NotificationQueue()
+        return _queue
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bandwidth
+import cbz
+import http_client
+import metrics
+import transcode
+
+BASE_URL = os.getenv("MDEX_API", "https://api.mangadex.org")
+CHUNK = 64 * 1024
+PAGE_WORKERS = int(os.getenv("MDEX_PAGE_WORKERS", 4))
+# Upper bound on page bytes held in memory across every worker in the process.
+MAX_INFLIGHT = int(os.getenv("MDEX_INFLIGHT_KB", 4096)) * 1024
+# CBZ chapters are assembled locally so the NAS only ever sees the finished archive.
+LOCAL_STAGING = os.path.expanduser(os.getenv("MDEX_STAGING", "~/.cache/mdex_staging"))
+
+
+class IncompleteChapter(Exception):
+    pass
+
+
+class ByteBudget:
+    """Counting semaphore over bytes: blocks a worker until its next chunk fits under the global cap."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n: int):
+        with self.cond:
+            # A single chunk bigger than the cap is still let through when nothing else is in flight.
+            while self.used and self.used + n > self.limit:
+                self.cond.wait()
+            self.used += n
+
+    def release(self, n: int):
+        with self.cond:
+            self.used -= n
+            self.cond.notify_all()
+
+
+BUDGET = ByteBudget(MAX_INFLIGHT)
+
+
+def staging_path(path_loc: str, storage: str = "dir") -> str:
+    """Where pages collect before the chapter is finished.
+
+    For directories this is a hidden sibling on the same filesystem, so the final
+    rename is atomic; for CBZ it is a local cache directory.
+    """
+    if storage == "cbz":
+        key = hashlib.sha1(path_loc.encode()).hexdigest()
+        return os.path.join(LOCAL_STAGING, key)
+    parent, name = os.path.split(path_loc.rstrip("/"))
+    return os.path.join(parent, f".{name}.part")
+
+
+def get_at_home(chapter_id: str, light: bool = False):
+    r = http_client.get(f"{BASE_URL}/at-home/server/{chapter_id}")
+    r.raise_for_status()
+    r_json = r.json()
+    quality = "dataSaver" if light else "data"
+    pages = r_json["chapter"][quality]
+    return f"{r_json['baseUrl']}/{'data-saver' if light else 'data'}/{r_json['chapter']['hash']}", pages
+
+
+def load_manifest(staging: str, chapter_id: str):
+    try:
+        with open(os.path.join(staging, ".manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("chapter_id") == chapter_id:
+            return manifest
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return {"chapter_id": chapter_id, "pages": {}}
+
+
+def save_manifest(staging: str, manifest: dict):
+    path = os.path.join(staging, ".manifest.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def page_name(number: int, filename: str) -> str:
+    return f"{number:03d}{os.path.splitext(filename)[1]}"
+
+
+def fetch_page(url: str, dest: str, record=None, priority: int = bandwidth.BACKFILL) -> int:
+    """Stream one page to disk CHUNK bytes at a time; the whole image is never held in memory.
+
+    Each chunk is paid for from the shared bandwidth scheduler at `priority` before it is written;
+    holding off the next read lets TCP slow the server down.
+    """
+    size = 0
+    writing = 0.0
+    throttled = 0.0
+    scheduler = bandwidth.get_scheduler()
+    start = time.perf_counter()
+    with http_client.get(url, stream=True) as r:
+        r.raise_for_status()
+        with open(f"{dest}.tmp", "wb") as f:
+            chunks = r.iter_content(CHUNK)
+            while True:
+                BUDGET.acquire(CHUNK)
+                try:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    throttled += scheduler.acquire(len(chunk), priority)
+                    write_start = time.perf_counter()
+                    f.write(chunk)
+                    writing += time.perf_counter() - write_start
+                    size += len(chunk)
+                finally:
+                    BUDGET.release(CHUNK)
+    os.replace(f"{dest}.tmp", dest)
+    metrics.add("fs_write", writing, record)
+    metrics.add("bandwidth_wait", throttled, record)
+    metrics.add("page_download", time.perf_counter() - start - writing - throttled, record)
+    return size
+
+
+def download_chapter(
+    chapter,
+    path_loc: str,
+    light: bool = False,
+    overwrite: bool = False,
+    progress=None,
+    storage: str = "dir",
+    info: dict = None,
+    priority: int = bandwidth.BACKFILL,
+):
+    """Fetch every page of `chapter` into a staging directory and move it to `path_loc` once all are there.
+
+    A manifest in the staging directory records finished pages, so an interrupted
+    run only fetches what is missing next time. Pages are fetched by PAGE_WORKERS
+    threads; `progress`, if given, is called with the running stats after each page.
+    With storage="cbz" the pages are packed into `path_loc`.cbz instead of being
+    moved into a directory, with a ComicInfo.xml built from the `info` fields
+    (series, volume, title, writer, web) once the page count is known. `priority` orders the
+    chapter's page reads against every other download sharing the bandwidth cap.
+    Returns a dict of pages, bytes, elapsed seconds and per-page latencies.
+    """
+    start = time.monotonic()
+    staging = staging_path(path_loc, storage)
+    os.makedirs(staging, exist_ok=True)
+    manifest = load_manifest(staging, chapter.id)
+    record = metrics.current()
+    with metrics.span("at_home", record):
+        base, pages = get_at_home(chapter.id, light)
+    if not pages:
+        # Externally hosted chapters have no pages on the at-home network.
+        shutil.rmtree(staging)
+        raise IncompleteChapter("chapter has no hosted pages")
+    stats = {"pages": 0, "bytes": 0, "elapsed": 0.0, "latencies": [], "saved": 0}
+    lock = threading.Lock()
+    failed = []
+    # Pages go to the transcode process pool as soon as they land, overlapping the rest of the chapter's downloads.
+    transcoding = transcode.enabled()
+    converted = manifest.setdefault("converted", {})
+    pending = []
+
+    def fetch(number, filename):
+        name = page_name(number, filename)
+        dest = os.path.join(staging, name)
+        if name in converted and os.path.exists(os.path.join(staging, converted[name])):
+            return
+        size = manifest["pages"].get(name)
+        if size is not None and os.path.exists(dest) and os.path.getsize(dest) == size:
+            if transcoding:
+                # Landed on an earlier run that stopped before converting it.
+                with lock:
+                    pending.append((name, transcode.submit(dest)))
+            return
+        page_start = time.monotonic()
+        try:
+            size = fetch_page(f"{base}/{filename}", dest, record, priority)
+        except Exception as e:
+            with lock:
+                failed.append((name, e))
+            return
+        with lock:
+            manifest["pages"][name] = size
+            save_manifest(staging, manifest)
+            stats["pages"] += 1
+            stats["bytes"] += size
+            stats["latencies"].append(time.monotonic() - page_start)
+            stats["elapsed"] = time.monotonic() - start
+            if transcoding:
+                pending.append((name, transcode.submit(dest)))
+            if progress:
+                progress(stats)
+
+    with ThreadPoolExecutor(max_workers=max(1, PAGE_WORKERS)) as pool:
+        list(pool.map(fetch, range(1, len(pages) + 1), pages))
+    if pending:
+        with metrics.span("transcode_wait", record):
+            for name, future in pending:
+                try:
+                    kept, before, after = future.result()
+                except Exception as e:
+                    # A page Pillow can't read is still a valid page; keep it as served.
+                    print(f"Could not transcode {name}: {e}")
+                    continue
+                converted[name] = os.path.basename(kept)
+                stats["saved"] += before - after
+        save_manifest(staging, manifest)
+        metrics.count("transcode_saved_bytes", stats["saved"], record)
+    stats["elapsed"] = time.monotonic() - start
+    if failed:
+        raise IncompleteChapter(f"{len(failed)}/{len(pages)} pages failed, first: {failed[0][1]}")
+    with metrics.span("fs_write", record):
+        if os.path.exists(os.path.join(staging, ".manifest.json")):
+            os.remove(os.path.join(staging, ".manifest.json"))
+        if storage == "cbz":
+            dest = cbz.cbz_path(path_loc)
+            if overwrite or not os.path.exists(dest):
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                names = [page_name(n, f) for n, f in enumerate(pages, start=1)]
+                fields = {"series": "", **(info or {})}
+                cbz.write_cbz(
+                    [os.path.join(staging, converted.get(name, name)) for name in names],
+                    dest,
+                    cbz.comic_info(number=str(chapter.chapter), pages=len(pages), **fields),
+                )
+            shutil.rmtree(staging)
+            metrics.count("pages", stats["pages"], record)
+            metrics.count("bytes", stats["bytes"], record)
+            return stats
+        if os.path.exists(path_loc):
+            if not overwrite:
+                shutil.rmtree(staging)
+                return stats
+            shutil.rmtree(path_loc)
+        os.replace(staging, path_loc.rstrip("/"))
+    metrics.count("pages", stats["pages"], record)
+    metrics.count("bytes", stats["bytes"], record)
+    return stats
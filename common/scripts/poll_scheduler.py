@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import heapq
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+
+STATE_PATH = os.path.expanduser("~/.cache/manga_update_schedule.json")
+MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", 15 * 60))
+MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", 24 * 60 * 60))
+# First re-check of a title whose release is overdue; each later one waits twice as long.
+LATE_INTERVAL = int(os.getenv("POLL_LATE_INTERVAL", 4 * MIN_INTERVAL))
+DEFAULT_INTERVAL = 6 * 60 * 60
+# Uploads this close together count as one release (bulk drops, multi-part chapters).
+SAME_RELEASE = 6 * 60 * 60
+DORMANT_AFTER = 90 * 24 * 60 * 60
+HISTORY = 20
+
+
+def parse_time(stamp: str) -> float:
+    return datetime.fromisoformat(stamp).timestamp()
+
+
+def release_times(stamps) -> list:
+    """Sorted release timestamps with bulk uploads folded together."""
+    times = sorted(parse_time(s) for s in stamps if s)
+    releases = []
+    for t in times:
+        if releases and t - releases[-1] < SAME_RELEASE:
+            continue
+        releases.append(t)
+    return releases[-HISTORY:]
+
+
+def next_poll(releases: list, now: float) -> float:
+    """When to look at a title again, given its release history.
+
+    Titles with a steady cadence are polled every MIN_INTERVAL inside a window
+    around their next expected release and only occasionally outside it. A
+    release that misses its window is re-checked after LATE_INTERVAL, then
+    after doubling gaps (1h, 2h, 4h, ...), until the next release's window.
+    Titles silent for DORMANT_AFTER (or without history) drift out to MAX_INTERVAL.
+    """
+    if len(releases) < 2:
+        return now + DEFAULT_INTERVAL
+    last = releases[-1]
+    if now - last > DORMANT_AFTER:
+        return now + MAX_INTERVAL
+    gap = statistics.median(b - a for a, b in zip(releases, releases[1:]))
+    gap = max(gap, MIN_INTERVAL)
+    window = min(max(gap / 20, 60 * 60), 4 * 60 * 60)
+    expected = last + gap
+    late = expected + window
+    if late < now < expected + gap - window:
+        # Late release: most turn up within hours, so check soon and back off geometrically
+        # rather than waiting a whole cadence, or polling a series on break all week.
+        step = LATE_INTERVAL
+        at = late + step
+        while at <= now:
+            step *= 2
+            at += step
+        return min(at, expected + gap - window)
+    # Skipped releases: step forward a cadence at a time until the window is ahead of us.
+    while expected + window < now:
+        expected += gap
+    if expected - window <= now:
+        return now + MIN_INTERVAL
+    idle = min(max(gap / 4, MIN_INTERVAL), MAX_INTERVAL)
+    return min(now + idle, expected - window)
+
+
+class RequestBudget:
+    """Token bucket over API requests for the whole daemon (e.g. 600 per hour)."""
+
+    def __init__(self, per_hour: float):
+        self.capacity = per_hour
+        self.tokens = per_hour
+        self.rate = per_hour / 3600
+        self.last = time.monotonic()
+
+    def wait_time(self, cost: float) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def spend(self, cost: float):
+        self.tokens -= cost
+
+
+class PollScheduler:
+    """Priority queue of titles keyed by their next poll time, persisted between daemon restarts."""
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.state = {}
+        self.heap = []
+
+    def sync(self, manga_ids: list, now: float):
+        """Track exactly `manga_ids`: new titles are due now, removed ones are forgotten."""
+        wanted = set(manga_ids)
+        for manga_id in list(self.state):
+            if manga_id not in wanted:
+                del self.state[manga_id]
+        for manga_id in manga_ids:
+            self.state.setdefault(manga_id, {"releases": [], "next": now, "seen": None})
+        self.heap = [(entry["next"], manga_id) for manga_id, entry in self.state.items()]
+        heapq.heapify(self.heap)
+
+    def peek(self):
+        while self.heap:
+            due, manga_id = self.heap[0]
+            entry = self.state.get(manga_id)
+            if entry is not None and entry["next"] == due:
+                return due, manga_id
+            heapq.heappop(self.heap)  # stale entry left behind by reschedule()/sync()
+        return None
+
+    def pop(self):
+        item = self.peek()
+        if item is not None:
+            heapq.heappop(self.heap)
+        return item
+
+    def reschedule(self, manga_id: str, stamps, seen, now: float):
+        entry = self.state[manga_id]
+        if stamps:
+            entry["releases"] = release_times(stamps)
+        if seen:
+            entry["seen"] = seen
+        entry["next"] = next_poll(entry["releases"], now)
+        heapq.heappush(self.heap, (entry["next"], manga_id))
+        return entry["next"]
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chapter_index import get_index
+
+STATE_PATH = os.path.expanduser("~/.cache/mdex_prune.json")
+WORKERS = int(os.getenv("PRUNE_WORKERS", 8))
+
+
+def new_counts():
+    return {"files": 0, "dirs": 0, "broken_chapters": 0}
+
+
+def prune_dir(path: str, counts: dict, dry_run: bool) -> bool:
+    """Bottom-up prune of one directory; True when it was (or would be) removed.
+
+    A leaf directory holding a zero-byte page is a broken chapter and goes as a
+    whole so it gets downloaded again; so does a zero-byte .cbz. Elsewhere zero-byte files are removed on
+    their own, and directories left empty are removed after their children.
+    Hidden entries (staging directories of downloads in progress) are left alone.
+    """
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return True
+    dirs = [e for e in entries if e.is_dir(follow_symlinks=False)]
+    empty_files = [
+        e
+        for e in entries
+        if not e.name.startswith(".")
+        and e.is_file(follow_symlinks=False)
+        and e.stat(follow_symlinks=False).st_size == 0
+    ]
+    archives = [e for e in entries if e.name.endswith(".cbz")]
+    if empty_files and not dirs and not archives:
+        counts["broken_chapters"] += 1
+        counts["files"] += len(entries)
+        counts["dirs"] += 1
+        if not dry_run:
+            shutil.rmtree(path)
+            get_index().remove(path + "/")
+        return True
+    remaining = len(entries)
+    for entry in empty_files:
+        counts["files"] += 1
+        remaining -= 1
+        if entry.name.endswith(".cbz"):
+            counts["broken_chapters"] += 1
+        if not dry_run:
+            os.remove(entry.path)
+            get_index().remove(entry.path)
+    for entry in dirs:
+        if not entry.name.startswith(".") and prune_dir(entry.path, counts, dry_run):
+            remaining -= 1
+    if remaining:
+        return False
+    counts["dirs"] += 1
+    if not dry_run:
+        os.rmdir(path)
+        get_index().remove(path + "/")
+    return True
+
+
+def touched_since(title_path: str, since: float) -> bool:
+    """Title or any of its volume directories changed after `since` (one level of stats, no full walk)."""
+    try:
+        if os.stat(title_path).st_mtime > since:
+            return True
+        return any(
+            e.stat(follow_symlinks=False).st_mtime > since
+            for e in os.scandir(title_path)
+            if e.is_dir(follow_symlinks=False)
+        )
+    except FileNotFoundError:
+        return False
+
+
+def last_run():
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f)["last_run"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def prune(root: str, dry_run: bool = False, since: float = None, workers: int = WORKERS):
+    """Prune every title under `root` in parallel; returns summed counts plus titles scanned and elapsed seconds."""
+    start = time.monotonic()
+    started_at = time.time()
+    titles = [
+        e.path
+        for e in os.scandir(root)
+        if e.is_dir(follow_symlinks=False) and not e.name.startswith(".")
+    ]
+    if since is not None:
+        titles = [t for t in titles if touched_since(t, since)]
+
+    def work(title):
+        counts = new_counts()
+        prune_dir(title, counts, dry_run)
+        return counts
+
+    totals = new_counts()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for counts in pool.map(work, titles):
+            for key, value in counts.items():
+                totals[key] += value
+    if not dry_run:
+        os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+        with open(STATE_PATH, "w") as f:
+            json.dump({"last_run": started_at}, f)
+    totals["titles"] = len(titles)
+    totals["elapsed"] = time.monotonic() - start
+    return totals
+
+
+if __name__ == "__main__":
+    from helper import MANGA_ROOT, clean_up_parents
+
+    clean_up_parents(
+        MANGA_ROOT, dry_run="--dry-run" in sys.argv, touched_only="--touched" in sys.argv
+    )
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# "" leaves pages as served, otherwise one of FORMATS.
+TARGET = os.getenv("MDEX_TRANSCODE", "").lower()
+QUALITY = int(os.getenv("MDEX_TRANSCODE_QUALITY", 80))
+WORKERS = int(os.getenv("MDEX_TRANSCODE_WORKERS", os.cpu_count() or 1))
+FORMATS = {
+    "webp": (".webp", "WEBP"),
+    "avif": (".avif", "AVIF"),
+    "png": (".png", "PNG"),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_warned = False
+
+
+def enabled(target: str = None) -> bool:
+    global _warned
+    target = TARGET if target is None else target
+    if not target:
+        return False
+    if Image is None or target not in FORMATS:
+        if not _warned:
+            reason = "Pillow is not installed" if Image is None else f"unknown format {target!r}"
+            print(f"Page transcoding disabled: {reason}")
+            _warned = True
+        return False
+    return True
+
+
+def pool() -> ProcessPoolExecutor:
+    """One process pool sized to the cores, shared by every chapter so transcoding overlaps downloads."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Page download threads are running by now; fork() would copy whatever locks
+            # they hold (SSL, logging, our own budgets) into the child half-taken.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=max(1, WORKERS), mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def transcode_page(path: str, target: str, quality: int):
+    """Re-encode one page in a worker process.
+
+    Returns (path kept, size before, size after). Pages already in the target
+    format, or whose re-encode comes out no smaller, are left untouched.
+    """
+    ext, fmt = FORMATS[target]
+    before = os.path.getsize(path)
+    with Image.open(path) as img:
+        if img.format == fmt and target != "png":
+            return path, before, before
+        out = os.path.splitext(path)[0] + ext
+        tmp = f"{out}.tmp"
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        if target == "png":
+            img.save(tmp, format=fmt, optimize=True)
+        elif target == "webp":
+            img.save(tmp, format=fmt, quality=quality, method=6)
+        else:
+            img.save(tmp, format=fmt, quality=quality)
+    after = os.path.getsize(tmp)
+    if after >= before:
+        os.remove(tmp)
+        return path, before, before
+    os.replace(tmp, out)
+    if out != path:
+        os.remove(path)
+    return out, before, after
+
+
+def submit(path: str, target: str = None, quality: int = None):
+    return pool().submit(transcode_page, path, target or TARGET, quality or QUALITY)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None